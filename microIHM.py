@@ -51,6 +51,8 @@ from kivy.uix.textinput import TextInput
 from kivy.properties import (ObjectProperty, ListProperty, StringProperty,
     NumericProperty, BooleanProperty)
 from kivy.uix.tabbedpanel import TabbedPanel,TabbedPanelItem
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
 from kivy.app import App
 from kivy.lang import Builder
 from kivy.clock import Clock
@@ -59,26 +61,47 @@ from kivy.garden.graph import Graph, MeshLinePlot
 #################### Database libraries, see sqlalchemy documentation
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import (create_engine, Column, Float, Integer, Numeric,
-    String,Boolean, DateTime, ForeignKey, update)
+    String,Boolean, DateTime, ForeignKey, update, event, Table, inspect, or_,
+    Index, select, and_, func, PrimaryKeyConstraint)
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker,relationship,backref
 #################### Python libraries, see each library documentation
 from datetime import datetime
 import time
 import re
-from pyfirmata import Arduino, util
+from pyfirmata import Arduino, SAMPLING_INTERVAL
 import sys
-from collections import OrderedDict
+from collections import OrderedDict, deque
 import webbrowser
 from functools import partial
 import serial
 import glob
 import linecache
+import threading
+import heapq
+import itertools
+import numpy as np
+import csv
+import json
+import struct
 
 # Establishing the window's background color
 Window.clearcolor = get_color_from_hex('#87FFFC')
 # Setting up database, see sqlalchemy documentation
-engine = create_engine('sqlite:///:memory:')
+# The database file is kept between runs, its path can be set with the
+# MICROIHM_DB environment variable
+DBFILE = os.environ.get('MICROIHM_DB', os.getcwd() + '/microIHM.db')
+engine = create_engine('sqlite:///' + DBFILE)
+
+# Write-ahead log, so that historian writes don't block readers
+@event.listens_for(engine, 'connect')
+def setwal(con, rec):
+    cur = con.cursor()
+    cur.execute('PRAGMA journal_mode=WAL')
+    cur.execute('PRAGMA synchronous=NORMAL')
+    cur.close()
+
 Session = sessionmaker(bind = engine)
 session = Session()
 Base = declarative_base()
@@ -89,6 +112,12 @@ class RTU(Base):
     RTU_id = Column(Integer,primary_key=True)
     RTU_name = Column(String(40))
     RTU_port = Column(String(40))
+    # Firmata sampling interval in ms, empty for the firmware default
+    RTU_sampling = Column(Integer)
+    # If not false only the pins linked on the display report their values
+    RTU_linked = Column(Boolean)
+    # Most output writes per second, empty for the default (see WRATE)
+    RTU_wrate = Column(Integer)
     #RTU_type = Column(String(40))
 
     DP=relationship('Dpoint',backref = 'rem1')
@@ -104,9 +133,14 @@ class Dpoint(Base):
     DP_pinno = Column(Integer)
     DP_pinmo = Column(String(40))
     DP_alarmer = Column(Boolean)
+    # Tag of the alarm of the same remote that causes the alarms of the point.
+    # They are consequential while it is active (see Alarms), empty for none
+    DP_cause = Column(String(40))
     DP_RTUid = Column(Integer,ForeignKey('remotes.RTU_id'))
+    # Set once the point is no longer configured on its remote. The row is
+    # kept for its history (see retire)
+    DP_retired = Column(Boolean, default = False)
 
-    DP = relationship('Pread', backref = 'Rdp')
     DAl = relationship('Alarm', backref = 'dal')
 
 class Ppoint(Base):
@@ -120,9 +154,14 @@ class Ppoint(Base):
     PP_min = Column(Float(2))
     PP_pinmo = Column(Integer)
     PP_RTUid = Column(Integer(),ForeignKey('remotes.RTU_id'))
+    # Set once the point is no longer configured on its remote. The row is
+    # kept for its history (see retire)
+    PP_retired = Column(Boolean, default = False)
     PP_unit = Column(String(20))
+    # Report-by-exception deadbands: absolute and percent of the span
+    PP_dbabs = Column(Float(2))
+    PP_dbpct = Column(Float(2))
 
-    PP = relationship('Pread', backref = 'Rpp')
 
 class Apoint(Base):
     __tablename__ = 'anapoints'
@@ -137,43 +176,921 @@ class Apoint(Base):
     AP_pinno = Column(Integer)
     AP_pinmo = Column(String(40))
     AP_RTUid = Column(Integer(),ForeignKey('remotes.RTU_id'))
+    # Set once the point is no longer configured on its remote. The row is
+    # kept for its history (see retire)
+    AP_retired = Column(Boolean, default = False)
     AP_graph = Column(Boolean)
     AP_unit = Column(String(20))
+    # Alarm deadband (hysteresis), empty for the default (see ALMDB)
+    AP_almdb = Column(Numeric(12,2))
+    # Report-by-exception deadbands: absolute and percent of the span
+    AP_dbabs = Column(Numeric(12,2))
+    AP_dbpct = Column(Numeric(12,2))
+    # Swinging door compression deviation, empty for no compression
+    AP_compdev = Column(Numeric(12,2))
+    # Tag of the alarm of the same remote that causes the alarms of the point.
+    # They are consequential while it is active (see Alarms), empty for none
+    AP_cause = Column(String(40))
 
-    AP = relationship('Pread', backref = 'Rap')
     AAl = relationship('Alarm', backref = 'aal')
 
+# Alarm journal, one row per raise, acknowledgement or clearing of an alarm
 class Alarm(Base):
     __tablename__ = 'alarmas'
+    __table_args__ = (Index('ix_alarmas_time', 'AL_time'),
+                      Index('ix_alarmas_apoint', 'AL_apoint', 'AL_time'),
+                      Index('ix_alarmas_dpoint', 'AL_dpoint', 'AL_time'))
 
     AL_id = Column(Integer, primary_key = True)
     AL_pnt = Column(String(30))
     AL_typ = Column(String(5))
-    AL_time = Column(String(20))
+    # Epoch time of the event in milliseconds
+    AL_time = Column(Float)
     AL_value = Column(Integer())
     AL_apoint = Column(Integer(), ForeignKey('anapoints.AP_id'))
     AL_dpoint = Column(Integer(), ForeignKey('digipoints.DP_id'))
+    # Journal event (see ACTIONS)
+    AL_action = Column(String(5))
 
-class Pread(Base):
-    __tablename__ = 'lecturas'
-
-    PR_id = Column(Integer, primary_key = True)
-    PR_val = Column(Integer)
-    PR_time = Column(String(20))
-    PR_typ = Column(String(2))
-    PR_apointid = Column(Integer(), ForeignKey('anapoints.AP_id'))
-    PR_dpointid = Column(Integer(), ForeignKey('digipoints.DP_id'))
-    PR_ppointid = Column(Integer(), ForeignKey('pwmpoints.PP_id'))
-
-RTU.__table__.drop(engine, True)
-Dpoint.__table__.drop(engine,True)
-Apoint.__table__.drop(engine,True)
-Ppoint.__table__.drop(engine, True)
-Alarm.__table__.drop(engine, True)
-Pread.__table__.drop(engine, True)
-
+# Only the missing tables are created, the existing data is kept
 Base.metadata.create_all(engine)
 
+# Returns the remote with that name, adding it to the database if needed.
+# If it was configured on a previous run its points are retired, the ones
+# loaded again are brought back by putpoint
+def openrtu(name):
+    q = session.query(RTU).filter(RTU.RTU_name == name).first()
+    if q == None:
+        q = RTU(RTU_name = name)
+        session.add(q)
+    else:
+        retire(q)
+    return q
+
+# Retires the points of a remote. They stay linked to it, so its history
+# still knows the remote. Points that were never written to the database are
+# just discarded
+def retire(q):
+    for rel in ('DP', 'AP', 'PP'):
+        pnts = getattr(q, rel)
+        for pnt in list(pnts):
+            if pnt in session.new:
+                pnts.remove(pnt)
+                session.expunge(pnt)
+            else:
+                setattr(pnt, rel + '_retired', True)
+
+# Point of type typ (see PKIND) of the remote q with the columns cols. The
+# point the remote already has with that tag, retired or not, is updated in
+# place, so a point keeps its id (and its history) across loads
+def putpoint(q, typ, **cols):
+    pre = typ.upper() + 'P_'
+    pnts = getattr(q, typ.upper() + 'P')
+    pnt = next((p for p in pnts if getattr(p, pre + 'tag') == cols[pre + 'tag']), None)
+    if pnt == None:
+        pnt = PCLASS[typ]()
+        pnts.append(pnt)
+        session.add(pnt)
+    for col, val in cols.items():
+        setattr(pnt, col, val)
+    setattr(pnt, pre + 'retired', False)
+    return pnt
+
+#################### Acquisition
+# Epoch time in seconds for the readings: a steady high resolution clock
+# anchored once to the wall clock, so close readings keep their order
+CLOCK = getattr(time, 'perf_counter', time.time)
+EPOCH = time.time() - CLOCK()
+
+def stamp():
+    return EPOCH + CLOCK()
+
+# Default number of times per second the outputs of a remote are written
+WRATE = 20
+
+# Arduino board with its own firmata command handlers. pyFirmata keeps them in
+# a class attribute shared by every board, so the readings of one board end up
+# in the pins of another when more than one board is open
+class Remote(Arduino):
+    def __init__(self, *args, **kwargs):
+        self._command_handlers = {}
+        # Called with the port number and arrival time of each digital message
+        self.ondigital = None
+        # Arrival time of the last reading of each analog pin (see stamp)
+        self.stamps = {}
+        super(Remote, self).__init__(*args, **kwargs)
+
+    # Times are taken as soon as each message is parsed
+    def _handle_analog_message(self, pin_nr, lsb, msb):
+        super(Remote, self)._handle_analog_message(pin_nr, lsb, msb)
+        self.stamps[pin_nr] = stamp()
+
+    # Digital messages come by port
+    def _handle_digital_message(self, port_nr, lsb, msb):
+        super(Remote, self)._handle_digital_message(port_nr, lsb, msb)
+        if self.ondigital != None:
+            self.ondigital(port_nr, stamp())
+
+# Latest readings of every remote, by (remote, tag), as tags are only unique
+# within a remote. Filled by the remote workers and read by the scan engine,
+# access is protected by a lock.
+# Changes of the digital inputs are posted as they arrive on edges, as
+# (time, remote, tag, reading). Appending and popping from the ends of a deque
+# is thread safe, so it needs no lock
+class Snapshot(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.vals = {}
+        self.tms = {}
+        self.edges = deque()
+
+    # Stores a list of (tag, reading, time) tuples of a remote, time being None
+    # for the pins with no reading time
+    def put(self, rem, rds):
+        with self.lock:
+            for tag, rd, tm in rds:
+                self.vals[(rem, tag)] = rd
+                if tm != None:
+                    self.tms[(rem, tag)] = tm
+
+    # Returns a copy of the readings of all remotes and of their times
+    def get(self):
+        with self.lock:
+            return dict(self.vals), dict(self.tms)
+
+# I/O worker of a remote. Opens the board, takes the pins linked on the display
+# and keeps reading the serial port, publishing the values on the snapshot
+class RTUWorker(threading.Thread):
+    def __init__(self, rem, port, snap):
+        super(RTUWorker, self).__init__()
+        self.daemon = True
+        self.rem = rem
+        self.port = port
+        self.snap = snap
+        # Pin definitions (tag: 'a:1:i') and pin objects of the linked points
+        self.defs = {}
+        self.pins = {}
+        # Linked digital inputs by port, (tag, pin), and their last readings
+        self.dins = {}
+        self.dlast = {}
+        # Pin number of the linked analog inputs
+        self.anums = {}
+        # Output values queued by tag, last values written and time of the
+        # last write (see write)
+        self.olock = threading.Lock()
+        self.outs = {}
+        self.sent = {}
+        self.wlast = 0
+        self.board = None
+        # Acquisition settings: firmata sampling interval in ms (0 keeps the
+        # firmware default) and reporting limited to the linked pins
+        self.sampling = 0
+        self.linked = True
+        self.wrate = WRATE
+        # Set when the board is ready to be used or failed to open
+        self.ready = threading.Event()
+        self.error = ''
+        self.alive = True
+
+    def run(self):
+        try:
+            self.board = Remote(self.port)
+            self.setup()
+            for tag, pdef in self.defs.items():
+                self.pins[tag] = self.board.get_pin(pdef)
+                bits = pdef.split(':')
+                if bits[0] == 'd' and bits[2] == 'i':
+                    self.dins.setdefault(int(bits[1]) // 8, []).append((tag, self.pins[tag]))
+                elif bits[0] == 'a':
+                    self.anums[tag] = int(bits[1])
+            self.board.ondigital = self.digital
+        except Exception as e:
+            self.error = str(e)
+            self.ready.set()
+            return
+        self.ready.set()
+        while self.alive:
+            if self.board.bytes_available():
+                while self.board.bytes_available():
+                    self.board.iterate()
+                self.snap.put(self.rem, [(tag, pin.read(), self.board.stamps.get(self.anums.get(tag))) for tag, pin in self.pins.items()])
+            else:
+                time.sleep(0.001)
+            self.flushout()
+        self.board.exit()
+
+    # Applies the acquisition settings to the board. Reporting is stopped on
+    # every analog pin and digital port without a linked input, get_pin starts
+    # it again for the linked ones
+    def setup(self):
+        if self.sampling > 0:
+            ms = min(int(self.sampling), 16383)
+            self.board.send_sysex(SAMPLING_INTERVAL, bytearray([ms % 128, ms >> 7]))
+        if self.linked:
+            ins = [pdef.split(':') for pdef in self.defs.values() if pdef.endswith(':i')]
+            for pin in self.board.analog:
+                if ['a', str(pin.pin_number), 'i'] not in ins:
+                    pin.disable_reporting()
+            for port in self.board.digital_ports:
+                if not [bits for bits in ins if bits[0] == 'd' and int(bits[1]) // 8 == port.port_number]:
+                    port.disable_reporting()
+
+    # Queues a value to write on the output pin of a tag. Called from the UI,
+    # the write is done by the worker (see flushout) and only the last value
+    # queued for each pin is written
+    def write(self, tag, val):
+        with self.olock:
+            self.outs[tag] = val
+
+    # Writes the queued outputs whose value changed since they were last
+    # written, no more than wrate times per second
+    def flushout(self):
+        if not self.outs or (self.wrate > 0 and CLOCK() - self.wlast < 1. / self.wrate):
+            return
+        with self.olock:
+            outs, self.outs = self.outs, {}
+        self.wlast = CLOCK()
+        for tag, val in outs.items():
+            if tag in self.pins and self.sent.get(tag) != val:
+                self.pins[tag].write(val)
+                self.sent[tag] = val
+
+    # Posts the changes of the linked inputs of a digital port (see Snapshot)
+    def digital(self, port, tm):
+        for tag, pin in self.dins.get(port, []):
+            if pin.value != self.dlast.get(tag):
+                self.dlast[tag] = pin.value
+                self.snap.edges.append((tm, self.rem, tag, pin.value))
+
+    # Stops reading and closes the port
+    def stop(self):
+        self.alive = False
+        if self.is_alive():
+            self.join(1)
+
+#################### Historian
+# Sampling period of the readings and period of the writes to the database,
+# in seconds. Samples are buffered in memory between writes
+SAMPLEP = 5
+FLUSHP = 60
+
+# Days of readings kept in the database, 0 keeps all of them. Can be set with
+# the MICROIHM_DAYS environment variable
+KEEPDAYS = int(os.environ.get('MICROIHM_DAYS', '0'))
+# Point types, in point key order (see pkey), and their classes
+PKIND = 'dap'
+PCLASS = {'d': Dpoint, 'a': Apoint, 'p': Ppoint}
+
+# Readings are stored by day, each day on its own table (lecturas_YYYYMMDD)
+# with the columns:
+# PR_time: epoch time in milliseconds
+# PR_pnt: point key, the point id and its type packed in an integer
+# PR_val: value
+# The primary key is (PR_pnt, PR_time), so the readings of a point in a time
+# range are read as one range of the key. Old days are deleted just by
+# dropping their table
+parts = {}
+
+# Point key of a point
+def pkey(typ, pid):
+    return pid * 4 + PKIND.index(typ)
+
+# Type and id of the point of a point key
+def pointof(key):
+    return PKIND[key % 4], key // 4
+
+# Tag of every point, by point key. One query per point type
+def tags():
+    tg = {}
+    for typ in PKIND:
+        tb = PCLASS[typ].__table__.c
+        pre = typ.upper() + 'P_'
+        for pid, tag in session.query(tb[pre + 'id'], tb[pre + 'tag']):
+            tg[pkey(typ, pid)] = tag
+    return tg
+
+# Registry of the points linked to a remote, by type, remote name and tag.
+# Loaded once at startup and kept in sync by the edits of the remotes (see
+# regpoint), so the scan, the alarms and the linking of the widgets read the
+# points without querying the database
+points = {}
+
+# Copy of the columns of a point, read under the same names as the point
+# itself, plus its type, remote name, id, tag and historian key
+class Pinfo(object):
+    def __init__(self, typ, rem, pnt):
+        for col in PCLASS[typ].__table__.columns:
+            setattr(self, col.name, getattr(pnt, col.name))
+        pre = typ.upper() + 'P_'
+        self.typ = typ
+        self.rem = rem
+        self.id = getattr(self, pre + 'id')
+        self.tag = getattr(self, pre + 'tag')
+        self.key = pkey(typ, self.id)
+
+# Type of a point object (see PKIND)
+def ptypeof(pnt):
+    for typ in PKIND:
+        if isinstance(pnt, PCLASS[typ]):
+            return typ
+
+# Fills the registry from the database
+def loadpoints():
+    points.clear()
+    for typ in PKIND:
+        cls = PCLASS[typ]
+        tb = cls.__table__.c
+        for pnt, rem in session.query(cls, RTU.RTU_name).join(RTU, tb[typ.upper() + 'P_RTUid'] == RTU.RTU_id).filter(tb[typ.upper() + 'P_retired'] == False):
+            points[(typ, rem, getattr(pnt, typ.upper() + 'P_tag'))] = Pinfo(typ, rem, pnt)
+
+# Adds or replaces a point of a remote on the registry. New points are
+# flushed first so they have an id
+def regpoint(pnt, rem):
+    typ = ptypeof(pnt)
+    if getattr(pnt, typ.upper() + 'P_id') == None:
+        session.flush()
+    unregpoint(pnt)
+    points[(typ, rem, getattr(pnt, typ.upper() + 'P_tag'))] = Pinfo(typ, rem, pnt)
+
+# Removes a point from the registry
+def unregpoint(pnt):
+    typ = ptypeof(pnt)
+    pid = getattr(pnt, typ.upper() + 'P_id')
+    for k in [k for k, p in points.items() if p.typ == typ and p.id == pid]:
+        del points[k]
+
+# Removes every point of a remote from the registry
+def unregrtu(rem):
+    for k in [k for k, p in points.items() if p.rem == rem]:
+        del points[k]
+
+# Database id of every point, by type, remote and tag (see points)
+def pointids():
+    return dict((k, p.id) for k, p in points.items())
+
+# Point keys holding the readings of an analog tag of a remote: those of its
+# points with that tag, retired or not (see retire)
+def tagkeys(rem, tag):
+    return sorted(pkey('a', pid) for pid, in session.query(Apoint.AP_id).join(RTU, Apoint.AP_RTUid == RTU.RTU_id).filter(RTU.RTU_name == rem, Apoint.AP_tag == tag))
+
+# Report-by-exception deadband of an element: the largest of its absolute
+# deadband and its percent deadband applied to its span. Changes not bigger
+# than it are not reported. Digital elements report every change
+def rbedb(kid):
+    if kid.ptyp == 'a':
+        span = kid.ch - kid.cl
+    elif kid.ptyp == 'p':
+        span = kid.ids['cnt'].max - kid.ids['cnt'].min
+    else:
+        return 0
+    return max(kid.dbabs, kid.dbpct * abs(span) / 100.)
+
+# Swinging door compression of the readings (time, value) of a point. Only the
+# readings needed to rebuild the rest by linear interpolation, within the
+# compression deviation, are archived: the last reading is archived when the
+# line from the last archived one to the new one doesn't fit, within the
+# deviation, all the readings in between
+class Door(object):
+    def __init__(self, dev):
+        self.dev = float(dev)
+        # Last archived reading and last reading taken, not archived yet
+        self.arch = None
+        self.held = None
+        # Slopes of the door from the last archived reading
+        self.smax = float('inf')
+        self.smin = float('-inf')
+
+    # Takes a reading and returns the readings to archive. Readings not newer
+    # than the last one taken are ignored
+    def add(self, tm, val):
+        if self.arch == None:
+            self.arch = (tm, val)
+            return [self.arch]
+        if tm <= (self.held or self.arch)[0]:
+            return []
+        out = []
+        sl = self.slope(tm, val)
+        if sl > self.smax or sl < self.smin:
+            # Door closed, the held reading is archived and a new door opens
+            out.append(self.held)
+            self.arch = self.held
+            self.smax = float('inf')
+            self.smin = float('-inf')
+        self.smax = min(self.smax, self.slope(tm, val + self.dev))
+        self.smin = max(self.smin, self.slope(tm, val - self.dev))
+        self.held = (tm, val)
+        return out
+
+    # Slope from the last archived reading
+    def slope(self, tm, val):
+        return (val - self.arch[1]) / float(tm - self.arch[0])
+
+    # Returns the held reading to archive when the readings stop
+    def close(self):
+        out = ([self.held] if self.held != None else [])
+        if self.held != None:
+            self.arch = self.held
+        self.held = None
+        self.smax = float('inf')
+        self.smin = float('-inf')
+        return out
+
+# Day (YYYYMMDD) of an epoch time in milliseconds
+def dayof(ms):
+    return time.strftime('%Y%m%d', time.localtime(ms / 1000.))
+
+# Table of the readings of a day, created if needed
+def partition(day):
+    if day not in parts:
+        parts[day] = Table('lecturas_' + day, Base.metadata,
+                           Column('PR_time', Integer, autoincrement = False),
+                           Column('PR_pnt', Integer, autoincrement = False),
+                           Column('PR_val', Float),
+                           PrimaryKeyConstraint('PR_pnt', 'PR_time'))
+        parts[day].create(session.connection(), checkfirst = True)
+    return parts[day]
+
+# Days stored in the database, oldest first
+def partdays():
+    return sorted(n[9:] for n in inspect(engine).get_table_names() if n.startswith('lecturas_'))
+
+# Writes the readings (dicts of PR_time, PR_pnt and PR_val) with a bulk
+# insert per day, and updates the rollups
+def store(rows):
+    days = OrderedDict()
+    for rd in rows:
+        days.setdefault(dayof(rd['PR_time']), []).append(rd)
+    for day, rds in days.items():
+        session.execute(partition(day).insert(), rds)
+    rollup(rows)
+    session.commit()
+
+# Resolutions of the rollups in seconds. The readings themselves are the
+# finest resolution
+ROLLUPS = [60, 900, 3600]
+
+# Rollup tables (rollup_<resolution>) with the minimum, maximum, sum and number
+# of readings of each point for each period. A period can have more than one
+# row (e.g. if the scan was stopped during it), they are merged when read
+rolls = {}
+for res in ROLLUPS:
+    rolls[res] = Table('rollup_%d' % res, Base.metadata,
+                       Column('RU_time', Integer),
+                       Column('RU_pnt', Integer),
+                       Column('RU_min', Float),
+                       Column('RU_max', Float),
+                       Column('RU_sum', Float),
+                       Column('RU_cnt', Integer),
+                       Index('ix_rollup_%d' % res, 'RU_pnt', 'RU_time'))
+Base.metadata.create_all(engine, tables = rolls.values())
+
+# Periods still open: (resolution, point key): [start, min, max, sum, count]
+rollacc = {}
+
+# Accumulates the readings on the open periods. Periods are written once a
+# reading of a later period arrives, or all of them if final
+def rollup(rows, final = False):
+    done = dict((res, []) for res in ROLLUPS)
+    for rd in rows:
+        for res in ROLLUPS:
+            st = rd['PR_time'] // (res * 1000) * res * 1000
+            acc = rollacc.get((res, rd['PR_pnt']))
+            if acc != None and acc[0] == st:
+                acc[1] = min(acc[1], rd['PR_val'])
+                acc[2] = max(acc[2], rd['PR_val'])
+                acc[3] += rd['PR_val']
+                acc[4] += 1
+                continue
+            if acc != None:
+                done[res].append(rd2roll(rd['PR_pnt'], acc))
+            rollacc[(res, rd['PR_pnt'])] = [st, rd['PR_val'], rd['PR_val'], rd['PR_val'], 1]
+    if final:
+        for (res, pnt), acc in rollacc.items():
+            done[res].append(rd2roll(pnt, acc))
+        rollacc.clear()
+    for res, rws in done.items():
+        if rws:
+            session.execute(rolls[res].insert(), rws)
+
+# Row of a rollup table for an accumulated period
+def rd2roll(pnt, acc):
+    return {'RU_time': acc[0], 'RU_pnt': pnt, 'RU_min': acc[1], 'RU_max': acc[2],
+            'RU_sum': acc[3], 'RU_cnt': acc[4]}
+
+# Writes the open rollup periods (e.g. when the scan stops)
+def closeroll():
+    rollup([], True)
+    session.commit()
+
+# Trend of the point keys of a tag (see tagkeys) between the epoch times t0
+# and t1 (ms) for a plot of w pixels, as rows of period start, minimum and
+# maximum in time order. The coarsest resolution that still fills the w pixels
+# is used, so that only a few thousand rows are read for long windows. Rows
+# are read by pages on a connection of its own, so the trend can be consumed
+# over several frames
+def trendrows(keys, t0, t1, w):
+    res = 0
+    for r in ROLLUPS:
+        if (t1 - t0) // (r * 1000) >= w:
+            res = r
+    qs = []
+    if res == 0:
+        for day in partdays():
+            if dayof(t0) <= day <= dayof(t1):
+                tb = partition(day)
+                qs.append(select([tb.c.PR_time, tb.c.PR_val.label('lo'), tb.c.PR_val.label('hi')])
+                          .where(and_(tb.c.PR_pnt.in_(keys), tb.c.PR_time >= t0, tb.c.PR_time < t1))
+                          .order_by(tb.c.PR_time))
+    else:
+        tb = rolls[res]
+        qs.append(select([tb.c.RU_time, func.min(tb.c.RU_min), func.max(tb.c.RU_max)])
+                  .where(and_(tb.c.RU_pnt.in_(keys), tb.c.RU_time >= t0, tb.c.RU_time < t1))
+                  .group_by(tb.c.RU_time).order_by(tb.c.RU_time))
+    con = engine.connect()
+    try:
+        for q in qs:
+            rs = con.execute(q)
+            rows = rs.fetchmany(PAGE)
+            while rows:
+                for rw in rows:
+                    yield tuple(rw)
+                rows = rs.fetchmany(PAGE)
+    finally:
+        con.close()
+
+# Drops the days older than keep days
+def prune(keep = KEEPDAYS):
+    if keep <= 0:
+        return
+    old = dayof((time.time() - keep * 86400) * 1000)
+    for day in partdays():
+        if day < old:
+            partition(day).drop(session.connection())
+            Base.metadata.remove(parts.pop(day))
+    session.commit()
+
+prune()
+loadpoints()
+
+#################### Reports
+# Rows fetched from the database at once by the reports
+PAGE = 5000
+# Alarm events and journal actions, in the order of their codes on the
+# binary reports. supp is the raise of an alarm suppressed by a flood
+EVENTS = ['d', 'L', 'LL', 'H', 'HH']
+ACTIONS = ['raise', 'ack', 'clear', 'supp']
+
+# Date and time of an epoch time in milliseconds
+def strtime(ms):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(ms / 1000.)) + '.%03d' % (ms % 1000)
+
+# Epoch time in milliseconds of a date written as YYYY-MM-DD, optionally
+# followed by HH:MM or HH:MM:SS. None if empty
+def parsetime(txt):
+    txt = txt.strip()
+    if txt == '':
+        return None
+    for fm in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return int(time.mktime(time.strptime(txt, fm)) * 1000)
+        except ValueError:
+            continue
+    raise ValueError('Invalid date: ' + txt)
+
+# Readings (time, point key, value) in time order, between the epoch times
+# t0 and t1 and of the points in keys, None meaning no filter. Rows are
+# fetched by pages, so memory use doesn't depend on the size of the range
+def readings(t0 = None, t1 = None, keys = None):
+    for day in partdays():
+        if (t0 != None and day < dayof(t0)) or (t1 != None and day > dayof(t1)):
+            continue
+        tb = partition(day)
+        q = tb.select().order_by(tb.c.PR_time)
+        if t0 != None:
+            q = q.where(tb.c.PR_time >= t0)
+        if t1 != None:
+            q = q.where(tb.c.PR_time <= t1)
+        if keys != None:
+            q = q.where(tb.c.PR_pnt.in_(keys))
+        res = session.execute(q)
+        rows = res.fetchmany(PAGE)
+        while rows:
+            for tm, pnt, val in rows:
+                yield tm, pnt, val
+            rows = res.fetchmany(PAGE)
+
+# Stored reading (time, point key, value) of a point that is closest to the
+# epoch time t, before it if back or else after it. None if there is none
+def edge(key, t, back):
+    for day in (partdays()[::-1] if back else partdays()):
+        if (back and day > dayof(t)) or (not back and day < dayof(t)):
+            continue
+        tb = partition(day)
+        if back:
+            q = tb.select().where(and_(tb.c.PR_pnt == key, tb.c.PR_time < t)).order_by(tb.c.PR_time.desc())
+        else:
+            q = tb.select().where(and_(tb.c.PR_pnt == key, tb.c.PR_time > t)).order_by(tb.c.PR_time)
+        rw = session.execute(q.limit(1)).first()
+        if rw != None:
+            return tuple(rw)
+    return None
+
+# Readings (time, point key, value) of a point every step ms from t0 to t1,
+# rebuilt by linear interpolation between the stored ones, which may be
+# compressed (see Door). Nothing is extrapolated past the stored readings
+def resample(key, t0, t1, step):
+    prev = edge(key, t0, True)
+    nxt = edge(key, t1, False)
+    g = t0
+    for tm, pnt, val in itertools.chain(readings(t0, t1, [key]), ([nxt] if nxt != None else [])):
+        while g <= t1 and g <= tm:
+            if g == tm:
+                yield g, key, val
+            elif prev != None:
+                yield g, key, prev[2] + (val - prev[2]) * (g - prev[0]) / float(tm - prev[0])
+            g += step
+        if g > t1:
+            return
+        prev = (tm, pnt, val)
+
+# Page of the alarm journal: up to n rows (time, point key or -1 if the row
+# has no point, event, action, value, id) in time order, between the epoch
+# times t0 and t1, of the points in keys and of the events with a priority in
+# prios (see PRIOS), None meaning no filter. The next page starts after the
+# (time, id) of the last row of the previous one, so every page is an index
+# range scan of the same cost
+def journal(t0 = None, t1 = None, keys = None, prios = None, after = None, n = PAGE):
+    q = session.query(Alarm.AL_time, Alarm.AL_apoint, Alarm.AL_dpoint, Alarm.AL_typ, Alarm.AL_action, Alarm.AL_value, Alarm.AL_id)
+    if t0 != None:
+        q = q.filter(Alarm.AL_time >= t0)
+    if t1 != None:
+        q = q.filter(Alarm.AL_time <= t1)
+    if keys != None:
+        q = q.filter(or_(Alarm.AL_apoint.in_([pointof(k)[1] for k in keys if pointof(k)[0] == 'a']),
+                         Alarm.AL_dpoint.in_([pointof(k)[1] for k in keys if pointof(k)[0] == 'd'])))
+    if prios != None:
+        q = q.filter(Alarm.AL_typ.in_([typ for typ, pr in PRIOS.items() if pr in prios]))
+    if after != None:
+        q = q.filter(or_(Alarm.AL_time > after[0], and_(Alarm.AL_time == after[0], Alarm.AL_id > after[1])))
+    q = q.order_by(Alarm.AL_time, Alarm.AL_id).limit(n)
+    return [(tm, (pkey('a', ap) if ap != None else (pkey('d', dp) if dp != None else -1)), typ, act, val, aid) for tm, ap, dp, typ, act, val, aid in q]
+
+# Alarm journal rows (time, point key, event, action, value) in time order,
+# with the filters of journal, read by pages
+def alarms(t0 = None, t1 = None, keys = None, prios = None):
+    rows = journal(t0, t1, keys, prios)
+    while rows:
+        for rw in rows:
+            yield rw[:5]
+        rows = journal(t0, t1, keys, prios, (rows[-1][0], rows[-1][5]))
+
+# Compact columnar file. A JSON header line holds the name and numpy dtype of
+# each column plus any extra information (e.g. the tag of each point key). It
+# is followed by blocks of up to PAGE rows: the number of rows of the block as
+# a little-endian uint32 and then each column as a raw array, which can be
+# loaded with numpy.frombuffer
+class Colfile(object):
+    def __init__(self, path, cols, **info):
+        self.fl = open(path, 'wb')
+        self.cols = cols
+        info['columns'] = cols
+        self.fl.write(json.dumps(info) + '\n')
+        self.bufs = [[] for col in cols]
+
+    def add(self, row):
+        for buf, val in zip(self.bufs, row):
+            buf.append(val)
+        if len(self.bufs[0]) >= PAGE:
+            self.dump()
+
+    # Writes the buffered rows as a block
+    def dump(self):
+        if self.bufs[0]:
+            self.fl.write(struct.pack('<I', len(self.bufs[0])))
+            for col, buf in zip(self.cols, self.bufs):
+                self.fl.write(np.array(buf, dtype = col[1]).tobytes())
+            self.bufs = [[] for col in self.cols]
+
+    def close(self):
+        self.dump()
+        self.fl.close()
+
+# Writes a report of readings or, if alm, of alarms (see readings and alarms)
+# in one of the formats:
+# txt: text report, readings grouped by time
+# csv: one line per row, with the tag of the point
+# bin: columnar file (see Colfile), with the tags and events on the header
+def report(path, fmt, rows, tg, alm = False):
+    if fmt == 'bin':
+        if alm:
+            fl = Colfile(path, [('time', '<i8'), ('point', '<i4'), ('event', '<i1'), ('action', '<i1'), ('value', '<f8')], tags = tg, events = EVENTS, actions = ACTIONS)
+        else:
+            fl = Colfile(path, [('time', '<i8'), ('point', '<i4'), ('value', '<f8')], tags = tg)
+        for rw in rows:
+            if alm:
+                rw = (int(rw[0]), rw[1], EVENTS.index(rw[2]), ACTIONS.index(rw[3]), rw[4])
+            fl.add(rw)
+        fl.close()
+        return
+    fl = open(path, ('wb' if fmt == 'csv' else 'w+'))
+    if fmt == 'csv':
+        wr = csv.writer(fl)
+        wr.writerow(['time', 'tag', 'event', 'action', 'value'] if alm else ['time', 'tag', 'value'])
+        for rw in rows:
+            wr.writerow([strtime(rw[0]), tg.get(rw[1], rw[1])] + list(rw[2:]))
+    elif alm:
+        for tm, pnt, typ, act, val in rows:
+            fl.write(strtime(tm) + '\r' + tg.get(pnt, str(pnt)) + '; ' + str(val) + '; ' + typ + '; ' + act + '\r\n')
+    else:
+        last = None
+        for tm, pnt, val in rows:
+            if tm != last:
+                if last != None:
+                    fl.write('\r\n')
+                fl.write(strtime(tm) + '\r')
+                last = tm
+            fl.write(tg.get(pnt, str(pnt)) + ', ' + str(val) + '; ')
+        if last != None:
+            fl.write('\r\n')
+    fl.close()
+
+# Builds a report file on the Reports folder from the fields of the report
+# popup: file name, from and to dates, tags separated by commas, format and
+# for readings an optional interval in seconds, to report the value of every
+# point at each interval instead of the stored readings (see resample)
+def mkreport(txt, frm, to, tgs, fmt, alm, stp = ''):
+    if not txt.endswith('.' + fmt):
+        txt = txt + '.' + fmt
+    path = os.getcwd() + '/Reports/' + txt
+    if os.path.isfile(path):
+        hey = Tempop(title = 'Error')
+        hey.ids['yo'].text = 'Duplicated file name'
+        hey.open()
+        return
+    try:
+        t0 = parsetime(frm)
+        t1 = parsetime(to)
+        step = (int(float(stp) * 1000) if stp.strip() != '' and not alm else 0)
+    except ValueError:
+        hey = Tempop(title = 'Error')
+        hey.ids['yo'].text = 'Invalid date or interval'
+        hey.open()
+        return
+    if step < 0 or (step > 0 and t0 == None):
+        hey = Tempop(title = 'Error')
+        hey.ids['yo'].text = 'Indicate start date and interval'
+        hey.open()
+        return
+    tg = tags()
+    names = [t.strip() for t in tgs.split(',') if t.strip() != '']
+    keys = ([k for k, t in tg.items() if t in names] if names else None)
+    if step > 0:
+        if t1 == None:
+            t1 = int(time.time() * 1000)
+        rows = heapq.merge(*[resample(k, t0, t1, step) for k in (keys if keys != None else tg.keys()) if pointof(k)[0] != 'd'])
+    else:
+        rows = (alarms if alm else readings)(t0, t1, keys)
+    report(path, fmt, rows, tg, alm)
+    hey = Tempop(title = 'Success')
+    hey.ids['yo'].text = 'Report created'
+    hey.open()
+
+#################### Trends
+# Default number of samples kept for each trend
+TRCAP = 3600
+# Colors of the trend pens, in order of creation
+PENCOLORS = [[0,0,1,1], [0.4,0.2,0.6,1], [0.9,0.9,0.05,1], [0.11,0.95,0.93,1],
+             [1,0.5,0,1], [0,0.8,0,1], [1,0.2,0.6,1], [1,1,1,1], [0.6,0.4,0.2,1],
+             [0.5,0.5,1,1], [0.8,0,0,1], [0,0.5,0.5,1], [0.7,0.9,0.5,1],
+             [0.5,0.5,0.5,1], [1,0.8,0.7,1], [0.3,0.6,1,1]]
+# Time windows of the trends in seconds, 0 for the live trend
+WINDOWS = OrderedDict([('Live', 0), ('1 h', 3600), ('24 h', 86400), ('7 d', 604800), ('30 d', 2592000)])
+
+# Fixed capacity buffer of the last samples of a trend and their epoch times.
+# Once full, each new sample overwrites the oldest one, so memory use doesn't
+# grow with time
+class Ring(object):
+    def __init__(self, cap):
+        self.buf = np.zeros(int(cap))
+        self.tms = np.zeros(int(cap))
+        # Samples appended since creation
+        self.n = 0
+
+    def __len__(self):
+        return min(self.n, len(self.buf))
+
+    def append(self, val, t):
+        self.buf[self.n % len(self.buf)] = val
+        self.tms[self.n % len(self.buf)] = t
+        self.n += 1
+
+    # Samples held, oldest first
+    def values(self):
+        return self.order(self.buf)
+
+    # Times of the samples held, oldest first
+    def times(self):
+        return self.order(self.tms)
+
+    def order(self, arr):
+        if self.n <= len(arr):
+            return arr[:self.n]
+        i = self.n % len(arr)
+        return np.concatenate((arr[i:], arr[:i]))
+
+# Reduces the samples of a trend (x positions and values) to the w pixel
+# columns of the plot. Each column is drawn as the minimum and maximum of its
+# samples, so peaks are kept no matter how many samples fall on a pixel.
+# Returns the plot points
+def decimate(xs, vals, w):
+    if len(vals) <= 2 * w:
+        return list(zip(xs.tolist(), vals.tolist()))
+    st = np.linspace(0, len(vals), w + 1).astype(int)[:-1]
+    ys = np.empty(2 * w)
+    ys[0::2] = np.minimum.reduceat(vals, st)
+    ys[1::2] = np.maximum.reduceat(vals, st)
+    return list(zip(np.repeat(xs[st], 2).tolist(), ys.tolist()))
+
+# Minimum and maximum of a trend on each of the w pixel columns of a window of
+# win ms starting at t0, filled as the rows of the trend arrive (see trendrows)
+class Buckets(object):
+    def __init__(self, t0, win, w):
+        self.t0 = t0
+        self.win = win
+        self.lo = np.full(w, np.nan)
+        self.hi = np.full(w, np.nan)
+
+    # Adds a chunk of rows, as a (n, 3) array
+    def add(self, rows):
+        idx = ((rows[:, 0] - self.t0) * len(self.lo) // self.win).astype(int).clip(0, len(self.lo) - 1)
+        np.fmin.at(self.lo, idx, rows[:, 1])
+        np.fmax.at(self.hi, idx, rows[:, 2])
+
+    # Plot points of the columns with data, x being the seconds since t0 and
+    # the values scaled by a pen (see Pen)
+    def points(self, pen):
+        cols = np.nonzero(~np.isnan(self.lo))[0]
+        xs = np.repeat(cols * (self.win / 1000.) / len(self.lo), 2)
+        ys = np.empty(2 * len(cols))
+        ys[0::2] = pen.scale(self.lo[cols])
+        ys[1::2] = pen.scale(self.hi[cols])
+        return list(zip(xs.tolist(), ys.tolist()))
+
+#################### Alarm evaluation
+# Default alarm deadband, as a fraction of the span of the point
+ALMDB = 0.01
+
+# Scaling and alarm limits of the analog inputs of a display held as arrays,
+# so that every point is scaled and classified in a single vectorized pass
+class Limits(object):
+    # Event name of each alarm state
+    names = {-2: 'LL', -1: 'L', 0: '', 1: 'H', 2: 'HH'}
+
+    def __init__(self, kids):
+        self.cl = np.array([kid.cl for kid in kids], dtype = float)
+        self.l = np.array([kid.l for kid in kids], dtype = float)
+        self.h = np.array([kid.h for kid in kids], dtype = float)
+        self.ch = np.array([kid.ch for kid in kids], dtype = float)
+        self.db = np.array([kid.almdb for kid in kids], dtype = float)
+        # Report-by-exception deadbands and last values reported
+        self.rdb = np.array([rbedb(kid) for kid in kids], dtype = float)
+        self.rep = np.full(len(kids), np.nan)
+        # Last values and alarm states (-2 LL, -1 L, 0 normal, 1 H, 2 HH)
+        self.vals = np.full(len(kids), np.nan)
+        self.state = np.zeros(len(kids), dtype = np.int8)
+
+    # Indexes of the values that changed by more than their report-by-exception
+    # deadband since they were last reported, which become the reported ones
+    def report(self, vals):
+        chg = np.nonzero(np.isnan(self.rep) | (np.abs(vals - self.rep) > self.rdb))[0]
+        self.rep[chg] = vals[chg]
+        return chg
+
+    # Converts normalized readings (0 to 1, nan if missing) to engineering
+    # units. Missing readings are shown as 0
+    def scale(self, rds):
+        return np.where(np.isnan(rds), 0, (self.ch - self.cl) * rds + self.cl)
+
+    # Classifies the current values and returns the indexes of the points
+    # whose alarm state changed along with the new states. A point enters a
+    # state when it crosses the limit, but only leaves it for a less severe
+    # one when it is back past the limit by more than its deadband
+    def evaluate(self):
+        v = self.vals
+        st = np.zeros(len(v), dtype = np.int8)
+        st[v > self.h] = 1
+        st[v < self.l] = -1
+        st[v <= self.cl] = -2
+        st[v >= self.ch] = 2
+        keep = (((self.state == 2) & (v >= self.ch - self.db)) |
+            ((self.state == 1) & (v > self.h - self.db)) |
+            ((self.state == -1) & (v < self.l + self.db)) |
+            ((self.state == -2) & (v <= self.cl + self.db)))
+        st = np.where(keep & (np.abs(st) <= np.abs(self.state)), self.state, st).astype(np.int8)
+        chg = np.nonzero(st != self.state)[0]
+        self.state = st
+        return chg, st
+
 #################### Kivy classes definition
 
 ########### Presentation screen
@@ -253,9 +1170,9 @@ class DBScreen(Screen):
                 q = session.query(RTU).filter(RTU.RTU_name == self.ids['RTUlst'].sel.text).first()
             else:
                 q = session.query(RTU).filter(RTU.RTU_name == remlog).first()
-            dgs = session.query(Dpoint).filter(Dpoint.DP_RTUid == q.RTU_id).all()
-            ants = session.query(Apoint).filter(Apoint.AP_RTUid == q.RTU_id).all()
-            pps = session.query(Ppoint).filter(Ppoint.PP_RTUid == q.RTU_id).all()
+            dgs = session.query(Dpoint).filter(Dpoint.DP_RTUid == q.RTU_id, Dpoint.DP_retired == False).all()
+            ants = session.query(Apoint).filter(Apoint.AP_RTUid == q.RTU_id, Apoint.AP_retired == False).all()
+            pps = session.query(Ppoint).filter(Ppoint.PP_RTUid == q.RTU_id, Ppoint.PP_retired == False).all()
             if not txt.endswith('.txt'):
                 txt = txt + '.txt'
             if os.path.isfile(os.getcwd() + '\Reports\\' + txt):
@@ -264,17 +1181,21 @@ class DBScreen(Screen):
                 nope.open()
             else:
                 fl = open(os.getcwd() + '\Reports\\' + txt, 'w+')
-                fl.write('RTU: ' + q.RTU_name + '\r\n')
+                fl.write('RTU: ' + q.RTU_name + '; ' + rtuset(q) + '\r\n')
                 ds = 'Dpoints: '
                 ans = 'Apoints: '
                 ps = 'Ppoints: '
                 for dg in dgs:
-                    ds = ds + dg.DP_pinmo + ', ' + dg.DP_tag + ', ' + ('S' if dg.DP_alarmer else 'N') + ', ' + dg.DP_descrip + ', ' + str(dg.DP_pinno)  + '; '
+                    ds = ds + dg.DP_pinmo + ', ' + dg.DP_tag + ', ' + ('S' if dg.DP_alarmer else 'N') + ', ' + dg.DP_descrip + ', ' + str(dg.DP_pinno) + ', ' + (dg.DP_cause or '') + '; '
                 for an in ants:
                     ans = (ans + an.AP_tag + ', ' + an.AP_descrip + ', ' + str(an.AP_clowlimit).strip('.')[0] + ', ' + str(an.AP_lowlimit).strip('.')[0] + ', ' + str(an.AP_hilimit).strip('.')[0]
-                        + ', ' + str(an.AP_chilimit).strip('.')[0] + ', ' + an.AP_unit + ',' + str(an.AP_pinno) + ', ' + ('S' if an.AP_graph else 'N') + '; ')
+                        + ', ' + str(an.AP_chilimit).strip('.')[0] + ', ' + an.AP_unit + ',' + str(an.AP_pinno) + ', ' + ('S' if an.AP_graph else 'N')
+                        + ', ' + ('' if an.AP_almdb == None else str(an.AP_almdb))
+                        + ', ' + ('' if an.AP_dbabs == None else str(an.AP_dbabs)) + ', ' + ('' if an.AP_dbpct == None else str(an.AP_dbpct))
+                        + ', ' + ('' if an.AP_compdev == None else str(an.AP_compdev))
+                        + ', ' + (an.AP_cause or '') + '; ')
                 for p in pps:
-                    ps = ps + p.PP_tag + ', ' + p.PP_descrip + ', ' + str(p.PP_max).strip('.')[0] + ', ' + str(p.PP_min).strip('.')[0] + ', ' + p.PP_unit + ',' + str(p.PP_pinno) + '; '
+                    ps = ps + p.PP_tag + ', ' + p.PP_descrip + ', ' + str(p.PP_max).strip('.')[0] + ', ' + str(p.PP_min).strip('.')[0] + ', ' + p.PP_unit + ',' + str(p.PP_pinno) + ', ' + ('' if p.PP_dbabs == None else str(p.PP_dbabs)) + ', ' + ('' if p.PP_dbpct == None else str(p.PP_dbpct)) + '; '
                 ds = ds.rstrip('; ')
                 ans = ans.rstrip('; ')
                 ps = ps.rstrip('; ')
@@ -294,20 +1215,24 @@ class DBScreen(Screen):
             else:
                 fl = open(os.getcwd() + '\Reports\\' + txt, 'w+')
                 for q in qs:
-                    fl.write('RTU: ' + q.RTU_name + '\r\n')
+                    fl.write('RTU: ' + q.RTU_name + '; ' + rtuset(q) + '\r\n')
                     ds = 'Dpoints: '
                     ans = 'Apoints: '
                     ps = 'Ppoints: '
-                    dgs = session.query(Dpoint).filter(Dpoint.DP_RTUid == q.RTU_id).all()
+                    dgs = session.query(Dpoint).filter(Dpoint.DP_RTUid == q.RTU_id, Dpoint.DP_retired == False).all()
                     for dg in dgs:
-                        ds = ds + dg.DP_pinmo + ', ' + dg.DP_tag + ', ' + ('S' if dg.DP_alarmer else 'N') + ', ' + dg.DP_descrip + ', ' + str(dg.DP_pinno)  + '; '
-                    ants = session.query(Apoint).filter(Apoint.AP_RTUid == q.RTU_id).all()
+                        ds = ds + dg.DP_pinmo + ', ' + dg.DP_tag + ', ' + ('S' if dg.DP_alarmer else 'N') + ', ' + dg.DP_descrip + ', ' + str(dg.DP_pinno) + ', ' + (dg.DP_cause or '') + '; '
+                    ants = session.query(Apoint).filter(Apoint.AP_RTUid == q.RTU_id, Apoint.AP_retired == False).all()
                     for an in ants:
                         ans = (ans + an.AP_tag + ', ' + an.AP_descrip + ', ' + str(an.AP_clowlimit).strip('.')[0] + ', ' + str(an.AP_lowlimit).strip('.')[0] + ', ' + str(an.AP_hilimit).strip('.')[0]
-                            + ', ' + str(an.AP_chilimit).strip('.')[0] + ', ' + an.AP_unit + ',' + str(an.AP_pinno) + ', ' + ('S' if an.AP_graph else 'N') + '; ')
-                    pps = session.query(Ppoint).filter(Ppoint.PP_RTUid == q.RTU_id).all()
+                            + ', ' + str(an.AP_chilimit).strip('.')[0] + ', ' + an.AP_unit + ',' + str(an.AP_pinno) + ', ' + ('S' if an.AP_graph else 'N')
+                            + ', ' + ('' if an.AP_almdb == None else str(an.AP_almdb))
+                            + ', ' + ('' if an.AP_dbabs == None else str(an.AP_dbabs)) + ', ' + ('' if an.AP_dbpct == None else str(an.AP_dbpct))
+                        + ', ' + ('' if an.AP_compdev == None else str(an.AP_compdev))
+                        + ', ' + (an.AP_cause or '') + '; ')
+                    pps = session.query(Ppoint).filter(Ppoint.PP_RTUid == q.RTU_id, Ppoint.PP_retired == False).all()
                     for p in pps:
-                        ps = ps + p.PP_tag + ', ' + p.PP_descrip + ', ' + str(p.PP_max).strip('.')[0] + ', ' + str(p.PP_min).strip('.')[0] + ', ' + p.PP_unit + ',' + str(p.PP_pinno) + '; '
+                        ps = ps + p.PP_tag + ', ' + p.PP_descrip + ', ' + str(p.PP_max).strip('.')[0] + ', ' + str(p.PP_min).strip('.')[0] + ', ' + p.PP_unit + ',' + str(p.PP_pinno) + ', ' + ('' if p.PP_dbabs == None else str(p.PP_dbabs)) + ', ' + ('' if p.PP_dbpct == None else str(p.PP_dbpct)) + '; '
                     ds = ds.rstrip('; ')
                     ans = ans.rstrip('; ')
                     ps = ps.rstrip('; ')
@@ -317,6 +1242,33 @@ class DBScreen(Screen):
                 ok.ids['yo'].text = 'Database exported'
                 ok.open()
 
+# Returns the float of an optional field of an imported point, None if the
+# field is missing or empty
+def optfloat(fields, n):
+    if len(fields) > n and fields[n].strip() != '':
+        return float(fields[n].strip())
+    return None
+
+# Returns the text of an optional field of an imported point, None if the
+# field is missing or empty
+def optstr(fields, n):
+    if len(fields) > n and fields[n].strip() != '':
+        return fields[n].strip()
+    return None
+
+# Acquisition settings of a remote as exported after its name: sampling
+# (ms), linked pins only (S/N) and writes per second, empty if not set
+def rtuset(q):
+    return '{0}, {1}, {2}'.format(('' if q.RTU_sampling == None else q.RTU_sampling),
+                                  ('N' if q.RTU_linked == False else 'S'),
+                                  ('' if q.RTU_wrate == None else q.RTU_wrate))
+
+# Name and acquisition settings of the RTU line of an exported remote. The
+# settings are None for files exported without them
+def rtuline(line):
+    fs = line.split(':', 1)[1].split(';')
+    return fs[0].strip(), ([s.strip() for s in fs[1].split(',')] if len(fs) > 1 else None)
+
 # Popup to name files (exports and reports)
 class Savepop(Popup):
     # This property identifies the class of the object that calls the popup
@@ -348,8 +1300,7 @@ class Chpop(Popup):
             fillpop = RTUPopup(caller = self.caller, size = (800,600))
             for line in txt:
                 if line.startswith('RTU'):
-                    ls = line.split(':')
-                    r = ls[1].strip()
+                    r, sets = rtuline(line)
                 if line.startswith('Dpoints'):
                     ls = line.split(':')
                     ds.append(ls[1].strip())
@@ -360,12 +1311,11 @@ class Chpop(Popup):
                     ls = line.split(':')
                     ps.append(ls[1].strip())
             if r not in self.caller.myrtus:
-                dbrem = RTU(
-                        RTU_name=r.strip()
-                        )
-                session.add(dbrem)
+                dbrem = openrtu(r.strip())
                 fillpop.nm = r.strip()
                 fillpop.ids['rname'].text = r.strip()
+                fillpop.showset(dbrem, sets)
+                fillpop.rtu = dbrem
                 ds = ds[0].split(';')
                 if ds[0] != '':
                     dno = 1
@@ -375,19 +1325,19 @@ class Chpop(Popup):
                 for d in ds:
                     if dno == 1:
                         d = d.split(',')
-                        newdp = Dpoint(
+                        newdp = putpoint(q, 'd',
                         DP_pinmo = d[0].strip(),
                         DP_tag = d[1].strip(),
                         DP_alarmer = (True if d[2].strip() == 'S' else False),
                         DP_descrip = d[3].strip(),
-                        DP_pinno = int(d[4].strip())
+                        DP_pinno = int(d[4].strip()),
+                        DP_cause = optstr(d, 5)
                         )
-                        newdp.rem1 = q
-                        session.add(newdp)
                         fillpop.ids['digi1'].ids['tag'].text = d[1].strip()
                         fillpop.ids['digi1'].ids['descrip'].text = d[3].strip()
                         fillpop.ids['digi1'].ids['pin'].text = d[4].strip()
                         fillpop.ids['digi1'].ids['pinmode'].text = d[0].strip()
+                        fillpop.ids['digi1'].ids['cause'].text = (optstr(d, 5) or '')
                         if d[2].strip() == 'S':
                             fillpop.ids['digi1'].ids['norstat'].active = True
                         else:
@@ -395,15 +1345,14 @@ class Chpop(Popup):
                         dno += 1
                     elif dno > 1:
                         d = d.split(',')
-                        newdp = Dpoint(
+                        newdp = putpoint(q, 'd',
                         DP_pinmo = d[0].strip(),
                         DP_tag = d[1].strip(),
                         DP_alarmer = (True if d[2].strip() == 'S' else False),
                         DP_descrip = d[3].strip(),
-                        DP_pinno = int(d[4].strip())
+                        DP_pinno = int(d[4].strip()),
+                        DP_cause = optstr(d, 5)
                         )
-                        newdp.rem1 = q
-                        session.add(newdp)
                         fillpop.ids['digi1'].autofill(d)
                 ans = ans[0].split(';')
                 if ans[0] != '':
@@ -413,7 +1362,7 @@ class Chpop(Popup):
                 for an in ans:
                     if ano == 1:
                         an = an.split(',')
-                        newap = Apoint(
+                        newap = putpoint(q, 'a',
                         AP_tag = an[0].strip(),
                         AP_descrip = an[1].strip(),
                         AP_clowlimit = float(an[2].strip()),
@@ -423,10 +1372,13 @@ class Chpop(Popup):
                         AP_unit = an[6].strip(),
                         AP_pinno = int(an[7].strip()),
                         AP_pinmo = 'I',
-                        AP_graph = (True if an[8].strip() == 'S' else False)
+                        AP_graph = (True if an[8].strip() == 'S' else False),
+                        AP_almdb = optfloat(an, 9),
+                        AP_dbabs = optfloat(an, 10),
+                        AP_dbpct = optfloat(an, 11),
+                        AP_compdev = optfloat(an, 12),
+                        AP_cause = optstr(an, 13)
                         )
-                        newap.rem2 = q
-                        session.add(newap)
                         fillpop.ids['ana1'].ids['tag'].text = an[0].strip()
                         fillpop.ids['ana1'].ids['descrip'].text = an[1].strip()
                         fillpop.ids['ana1'].ids['LL'].text = an[2].strip()
@@ -435,6 +1387,11 @@ class Chpop(Popup):
                         fillpop.ids['ana1'].ids['HH'].text = an[5].strip()
                         fillpop.ids['ana1'].ids['unit'].text = an[6].strip()
                         fillpop.ids['ana1'].ids['pin'].text = an[7].strip()
+                        fillpop.ids['ana1'].ids['almdb'].text = (an[9].strip() if len(an) > 9 else '')
+                        fillpop.ids['ana1'].ids['dbabs'].text = (an[10].strip() if len(an) > 10 else '')
+                        fillpop.ids['ana1'].ids['dbpct'].text = (an[11].strip() if len(an) > 11 else '')
+                        fillpop.ids['ana1'].ids['compdev'].text = (an[12].strip() if len(an) > 12 else '')
+                        fillpop.ids['ana1'].ids['cause'].text = (optstr(an, 13) or '')
                         if an[8].strip() == 'S':
                             fillpop.ids['ana1'].ids['gr'].active = True
                         else:
@@ -442,7 +1399,7 @@ class Chpop(Popup):
                         ano += 1
                     elif ano > 1:
                         an = an.split(',')
-                        newap = Apoint(
+                        newap = putpoint(q, 'a',
                         AP_tag = an[0].strip(),
                         AP_descrip = an[1].strip(),
                         AP_clowlimit = float(an[2].strip()),
@@ -452,10 +1409,13 @@ class Chpop(Popup):
                         AP_unit = an[6].strip(),
                         AP_pinno = int(an[7].strip()),
                         AP_pinmo = 'I',
-                        AP_graph = (True if an[8].strip() == 'S' else False)
+                        AP_graph = (True if an[8].strip() == 'S' else False),
+                        AP_almdb = optfloat(an, 9),
+                        AP_dbabs = optfloat(an, 10),
+                        AP_dbpct = optfloat(an, 11),
+                        AP_compdev = optfloat(an, 12),
+                        AP_cause = optstr(an, 13)
                         )
-                        newap.rem2 = q
-                        session.add(newap)
                         fillpop.ids['ana1'].autofill(an)
                 ps = ps[0].split(';')
                 if ps[0] != '':
@@ -465,37 +1425,39 @@ class Chpop(Popup):
                 for p in ps:
                     if pno == 1:
                         p = p.split(',')
-                        newpp = Ppoint(
+                        newpp = putpoint(q, 'p',
                                 PP_tag = p[0].strip(),
                                 PP_descrip = p[1].strip(),
                                 PP_max = int(p[2].strip()),
                                 PP_min = int(p[3].strip()),
                                 PP_unit = p[4].strip(),
                                 PP_pinno = int(p[5].strip()),
-                                PP_pinmo= 'P'
+                                PP_pinmo= 'P',
+                                PP_dbabs = optfloat(p, 6),
+                                PP_dbpct = optfloat(p, 7)
                                 )
-                        newpp.rem3=q
-                        session.add(newpp)
                         fillpop.ids['p1'].ids['tag'].text = p[0].strip()
                         fillpop.ids['p1'].ids['descrip'].text = p[1].strip()
                         fillpop.ids['p1'].ids['maxi'].text = p[2].strip()
                         fillpop.ids['p1'].ids['mini'].text = p[3].strip()
                         fillpop.ids['p1'].ids['unit'].text = p[4].strip()
                         fillpop.ids['p1'].ids['pin'].text = p[5].strip()
+                        fillpop.ids['p1'].ids['dbabs'].text = (p[6].strip() if len(p) > 6 else '')
+                        fillpop.ids['p1'].ids['dbpct'].text = (p[7].strip() if len(p) > 7 else '')
                         pno += 1
                     elif pno > 1:
                         p = p.split(',')
-                        newpp = Ppoint(
+                        newpp = putpoint(q, 'p',
                                 PP_tag = p[0].strip(),
                                 PP_descrip = p[1].strip(),
                                 PP_max = int(p[2].strip()),
                                 PP_min = int(p[3].strip()),
                                 PP_unit = p[4].strip(),
                                 PP_pinno = int(p[5].strip()),
-                                PP_pinmo= 'P'
+                                PP_pinmo= 'P',
+                                PP_dbabs = optfloat(p, 6),
+                                PP_dbpct = optfloat(p, 7)
                                 )
-                        newpp.rem3=q
-                        session.add(newpp)
                         fillpop.ids['p1'].autofill(p)
                 ok = Tempop(title = 'Success')
                 ok.ids['yo'].text = 'Remote loaded'
@@ -510,9 +1472,8 @@ class Chpop(Popup):
             rs = []
             for line in txt:
                 if line.startswith('RTU'):
-                    ls = line.split(':')
-                    rs.append(ls[1].strip())
-            for r in rs:
+                    rs.append(rtuline(line))
+            for r, sets in rs:
                 if r not in self.caller.myrtus:
                     txt = open(filename[0])
                     for num, line in enumerate(txt, 1):
@@ -530,12 +1491,11 @@ class Chpop(Popup):
                             ln = linecache.getline(filename[0], num + 9)
                             ls = ln.split(':')
                             ps.append(ls[1].strip())
-                            dbrem = RTU(
-                                    RTU_name=r.strip()
-                                    )
-                            session.add(dbrem)
+                            dbrem = openrtu(r.strip())
                             fillpop.nm = r.strip()
                             fillpop.ids['rname'].text = r.strip()
+                            fillpop.showset(dbrem, sets)
+                            fillpop.rtu = dbrem
                             linecache.clearcache()
                             ds = ds[0].split(';')
                             if ds[0] != '':
@@ -546,19 +1506,19 @@ class Chpop(Popup):
                             for d in ds:
                                 if dno == 1:
                                     d = d.split(',')
-                                    newdp = Dpoint(
+                                    newdp = putpoint(q, 'd',
                                             DP_pinmo = d[0].strip(),
                                             DP_tag = d[1].strip(),
                                             DP_alarmer = (True if d[2].strip() == 'S' else False),
                                             DP_descrip = d[3].strip(),
-                                            DP_pinno = int(d[4].strip())
+                                            DP_pinno = int(d[4].strip()),
+                                            DP_cause = optstr(d, 5)
                                             )
-                                    newdp.rem1 = q
-                                    session.add(newdp)
                                     fillpop.ids['digi1'].ids['tag'].text = d[1].strip()
                                     fillpop.ids['digi1'].ids['descrip'].text = d[3].strip()
                                     fillpop.ids['digi1'].ids['pin'].text = d[4].strip()
                                     fillpop.ids['digi1'].ids['pinmode'].text = d[0].strip()
+                                    fillpop.ids['digi1'].ids['cause'].text = (optstr(d, 5) or '')
                                     if d[2].strip() == 'S':
                                         fillpop.ids['digi1'].ids['norstat'].active = True
                                     else:
@@ -566,15 +1526,14 @@ class Chpop(Popup):
                                     dno += 1
                                 elif dno > 1:
                                     d = d.split(',')
-                                    newdp = Dpoint(
+                                    newdp = putpoint(q, 'd',
                                             DP_pinmo = d[0].strip(),
                                             DP_tag = d[1].strip(),
                                             DP_alarmer = (True if d[2].strip() == 'S' else False),
                                             DP_descrip = d[3].strip(),
-                                            DP_pinno = int(d[4].strip())
+                                            DP_pinno = int(d[4].strip()),
+                                            DP_cause = optstr(d, 5)
                                             )
-                                    newdp.rem1 = q
-                                    session.add(newdp)
                                     fillpop.ids['digi1'].autofill(d)
                             ans = ans[0].split(';')
                             if ans[0] != '':
@@ -584,7 +1543,7 @@ class Chpop(Popup):
                             for an in ans:
                                 if ano == 1:
                                     an = an.split(',')
-                                    newap = Apoint(
+                                    newap = putpoint(q, 'a',
                                                 AP_tag = an[0].strip(),
                                                 AP_descrip = an[1].strip(),
                                                 AP_clowlimit = float(an[2].strip()),
@@ -594,10 +1553,13 @@ class Chpop(Popup):
                                                 AP_unit = an[6].strip(),
                                                 AP_pinno = int(an[7].strip()),
                                                 AP_pinmo = 'I',
-                                                AP_graph = (True if an[8].strip() == 'S' else False)
+                                                AP_graph = (True if an[8].strip() == 'S' else False),
+                                                AP_almdb = optfloat(an, 9),
+                                                AP_dbabs = optfloat(an, 10),
+                                                AP_dbpct = optfloat(an, 11),
+                                                AP_compdev = optfloat(an, 12),
+                                                AP_cause = optstr(an, 13)
                                                 )
-                                    newap.rem2 = q
-                                    session.add(newap)
                                     fillpop.ids['ana1'].ids['tag'].text = an[0].strip()
                                     fillpop.ids['ana1'].ids['descrip'].text = an[1].strip()
                                     fillpop.ids['ana1'].ids['LL'].text = an[2].strip()
@@ -606,13 +1568,18 @@ class Chpop(Popup):
                                     fillpop.ids['ana1'].ids['HH'].text = an[5].strip()
                                     fillpop.ids['ana1'].ids['unit'].text = an[6].strip()
                                     fillpop.ids['ana1'].ids['pin'].text = an[7].strip()
+                                    fillpop.ids['ana1'].ids['almdb'].text = (an[9].strip() if len(an) > 9 else '')
+                                    fillpop.ids['ana1'].ids['dbabs'].text = (an[10].strip() if len(an) > 10 else '')
+                                    fillpop.ids['ana1'].ids['dbpct'].text = (an[11].strip() if len(an) > 11 else '')
+                                    fillpop.ids['ana1'].ids['compdev'].text = (an[12].strip() if len(an) > 12 else '')
+                                    fillpop.ids['ana1'].ids['cause'].text = (optstr(an, 13) or '')
                                     if an[8].strip() == 'S':
                                         fillpop.ids['ana1'].ids['gr'].active = True
                                     else:
                                         fillpop.ids['ana1'].ids['gr'].active = False
                                     ano += 1
                                 elif ano > 1:
-                                    newap = Apoint(
+                                    newap = putpoint(q, 'a',
                                                 AP_tag = an[0].strip(),
                                                 AP_descrip = an[1].strip(),
                                                 AP_clowlimit = float(an[2].strip()),
@@ -622,10 +1589,13 @@ class Chpop(Popup):
                                                 AP_unit = an[6].strip(),
                                                 AP_pinno = int(an[7].strip()),
                                                 AP_pinmo = 'I',
-                                                AP_graph = (True if an[8].strip() == 'S' else False)
+                                                AP_graph = (True if an[8].strip() == 'S' else False),
+                                                AP_almdb = optfloat(an, 9),
+                                                AP_dbabs = optfloat(an, 10),
+                                                AP_dbpct = optfloat(an, 11),
+                                                AP_compdev = optfloat(an, 12),
+                                                AP_cause = optstr(an, 13)
                                                 )
-                                    newap.rem2 = q
-                                    session.add(newap)
                                     fillpop.ids['ana1'].autofill(an)
                             ps = ps[0].split(';')
                             if ps[0] != '':
@@ -635,36 +1605,38 @@ class Chpop(Popup):
                             for p in ps:
                                 if pno == 1:
                                     p = p.split(',')
-                                    newpp = Ppoint(
+                                    newpp = putpoint(q, 'p',
                                             PP_tag = p[0].strip(),
                                             PP_descrip = p[1].strip(),
                                             PP_max = int(p[2].strip()),
                                             PP_min = int(p[3].strip()),
                                             PP_unit = p[4].strip(),
                                             PP_pinno = int(p[5].strip()),
-                                            PP_pinmo= 'P'
+                                            PP_pinmo= 'P',
+                                            PP_dbabs = optfloat(p, 6),
+                                            PP_dbpct = optfloat(p, 7)
                                             )
-                                    newpp.rem3 = q
-                                    session.add(newpp)
                                     fillpop.ids['p1'].ids['tag'].text = p[0].strip()
                                     fillpop.ids['p1'].ids['descrip'].text = p[1].strip()
                                     fillpop.ids['p1'].ids['maxi'].text = p[2].strip()
                                     fillpop.ids['p1'].ids['mini'].text = p[3].strip()
                                     fillpop.ids['p1'].ids['unit'].text = p[4].strip()
                                     fillpop.ids['p1'].ids['pin'].text = p[5].strip()
+                                    fillpop.ids['p1'].ids['dbabs'].text = (p[6].strip() if len(p) > 6 else '')
+                                    fillpop.ids['p1'].ids['dbpct'].text = (p[7].strip() if len(p) > 7 else '')
                                     pno += 1
                                 elif pno > 1:
-                                    newpp = Ppoint(
+                                    newpp = putpoint(q, 'p',
                                             PP_tag = p[0].strip(),
                                             PP_descrip = p[1].strip(),
                                             PP_max = int(p[2].strip()),
                                             PP_min = int(p[3].strip()),
                                             PP_unit = p[4].strip(),
                                             PP_pinno = int(p[5].strip()),
-                                            PP_pinmo= 'P'
+                                            PP_pinmo= 'P',
+                                            PP_dbabs = optfloat(p, 6),
+                                            PP_dbpct = optfloat(p, 7)
                                             )
-                                    newpp.rem3 = q
-                                    session.add(newpp)
                                     fillpop.ids['p1'].autofill(p)
                     fillpop.comrtu()
                     ok = Tempop(title = 'Success')
@@ -686,6 +1658,33 @@ class RTUPopup(Popup):
     atabsno = NumericProperty(1)
     # Ptabs on the popup
     ptabsno = NumericProperty(1)
+    # Remote of the popup on the database (see dbrtu)
+    rtu = ObjectProperty(None, allownone = True)
+
+    # Remote of the popup on the database. The first time, or if the name
+    # changed, it is opened (see openrtu), so the points a previous run stored
+    # under the same name are retired instead of mixed with the new ones
+    def dbrtu(self):
+        if self.rtu == None or self.rtu.RTU_name != self.ids['rname'].text:
+            self.rtu = openrtu(self.ids['rname'].text)
+        return self.rtu
+
+    # Shows the acquisition settings of a remote already on the database
+    def on_open(self, *args):
+        self.showset(session.query(RTU).filter(RTU.RTU_name == self.ids['rname'].text).first())
+
+    # Fills the acquisition settings with the ones of an imported remote (see
+    # rtuline), or with those of the remote q on the database if it has none,
+    # so that saving the remote keeps them
+    def showset(self, q, sets = None):
+        if sets != None and len(sets) > 2:
+            self.ids['smp'].text = sets[0]
+            self.ids['lnk'].active = (sets[1] != 'N')
+            self.ids['wrt'].text = sets[2]
+        elif q != None:
+            self.ids['smp'].text = ('' if q.RTU_sampling == None else str(q.RTU_sampling))
+            self.ids['lnk'].active = (q.RTU_linked != False)
+            self.ids['wrt'].text = ('' if q.RTU_wrate == None else str(q.RTU_wrate))
 
     # Method that adds the remote to the list
     def comrtu(self,*args):
@@ -700,13 +1699,23 @@ class RTUPopup(Popup):
             hey.open()
         else:
             self.caller.ids['RTUlst'].add_elm(self.nm)
+            q = session.query(RTU).filter(RTU.RTU_name == self.nm).first()
+            if q == None:
+                q = RTU(RTU_name = self.nm)
+                session.add(q)
+            q.RTU_sampling = (int(float(self.ids['smp'].text)) if self.ids['smp'].text != '' else None)
+            q.RTU_linked = self.ids['lnk'].active
+            q.RTU_wrate = (int(float(self.ids['wrt'].text)) if self.ids['wrt'].text != '' else None)
             session.commit()
+            loadpoints()
             self.caller.myrtus[self.nm] = self
             self.caller.manager.get_screen('ihmsc').ids['ihm'].ids['remsel'].values.append(self.nm)
 
     # Methos that cancels changes made to the DB
     def rollrtu(self,*args):
         session.rollback()
+        self.rtu = None
+        loadpoints()
 
 # The next three classes are the tabs that a RTUpopup holds. Same name
 # properties on them fulfill the same purposes
@@ -720,7 +1729,7 @@ class Digitab(TabbedPanelItem):
     pnt = ObjectProperty()
 
     # Validates the data input on the tab
-    def savedp(self,tag,stat,desc,pinno,pinmo,*args):
+    def savedp(self,tag,stat,desc,pinno,pinmo,cause = '',*args):
         self.rnamem = self.parent.parent.parent.parent.parent.parent.parent.parent.parent.ids['rname'].text
         if self.rnamem == '':
             hey = Tempop(title = 'Not saved')
@@ -734,20 +1743,16 @@ class Digitab(TabbedPanelItem):
             pass
         else:
             self.dps.append(self.id)
-            q = session.query(RTU).filter(RTU.RTU_name == self.rnamem).first()
-            if q == None:
-                newr = RTU(RTU_name = self.rnamem)
-                session.add(newr)
-                q = session.query(RTU).filter(RTU.RTU_name == self.rnamem).first()
-            newdp = Dpoint(
+            q = self.parent.parent.parent.parent.parent.parent.parent.parent.parent.dbrtu()
+            newdp = putpoint(q, 'd',
                         DP_tag = tag,
                         DP_descrip = desc,
                         DP_alarmer = stat,
                         DP_pinno = int(pinno),
-                        DP_pinmo = pinmo
+                        DP_pinmo = pinmo,
+                        DP_cause = (cause.strip() or None)
                         )
-            newdp.rem1 = q
-            session.add(newdp)
+            regpoint(newdp, self.rnamem)
             self.pnt = newdp
             hey = Tempop(title = tag)
             hey.open()
@@ -766,6 +1771,7 @@ class Digitab(TabbedPanelItem):
         newdtab.ids['descrip'].text = dp[3].strip()
         newdtab.ids['pin'].text = dp[4].strip()
         newdtab.ids['pinmode'].text = dp[0].strip()
+        newdtab.ids['cause'].text = (optstr(dp, 5) or '')
         if dp[2].strip() == 'S':
             newdtab.ids['norstat'].active = True
         else:
@@ -789,6 +1795,7 @@ class Digitab(TabbedPanelItem):
             self.parent.remove_widget(self)
             if self.id in self.dps:
                 self.dps.pop(int(self.dps.index(self.id)))
+                unregpoint(self.pnt)
                 session.delete(self.pnt)
                 q = session.query(Dpoint).all()
 
@@ -799,7 +1806,7 @@ class Anatab(TabbedPanelItem):
     pnt = ObjectProperty()
 
     # Same as savedp in digitab
-    def saveap(self,tag,desc,L,LL,H,HH,pinno,pinmo,gr,unit,*args):
+    def saveap(self,tag,desc,L,LL,H,HH,pinno,pinmo,gr,unit,almdb,dbabs,dbpct,compdev,cause = '',*args):
         self.rnamem = self.parent.parent.parent.parent.parent.parent.parent.parent.parent.ids['rname'].text
         if self.rnamem == '':
             hey = Tempop(title = 'Not saved')
@@ -813,12 +1820,8 @@ class Anatab(TabbedPanelItem):
             hey.open()
         else:
             self.aps.append(self.id)
-            q = session.query(RTU).filter(RTU.RTU_name == self.rnamem).first()
-            if q == None:
-                newr = RTU(RTU_name = self.rnamem)
-                session.add(newr)
-                q = session.query(RTU).filter(RTU.RTU_name == self.rnamem).first()
-            newap = Apoint(
+            q = self.parent.parent.parent.parent.parent.parent.parent.parent.parent.dbrtu()
+            newap = putpoint(q, 'a',
                         AP_tag = tag,
                         AP_descrip = desc,
                         AP_lowlimit = float(L),
@@ -828,10 +1831,14 @@ class Anatab(TabbedPanelItem):
                         AP_pinno = int(pinno),
                         AP_pinmo = pinmo,
                         AP_graph = gr,
-                        AP_unit = unit
+                        AP_unit = unit,
+                        AP_almdb = (float(almdb) if almdb != '' else None),
+                        AP_dbabs = (float(dbabs) if dbabs != '' else None),
+                        AP_dbpct = (float(dbpct) if dbpct != '' else None),
+                        AP_compdev = (float(compdev) if compdev != '' else None),
+                        AP_cause = (cause.strip() or None)
                         )
-            newap.rem2 = q
-            session.add(newap)
+            regpoint(newap, self.rnamem)
             self.pnt = newap
             hey = Tempop(title = tag)
             hey.open()
@@ -852,6 +1859,11 @@ class Anatab(TabbedPanelItem):
         newatab.ids['HH'].text = an[5].strip()
         newatab.ids['unit'].text = an[6].strip()
         newatab.ids['pin'].text = an[7].strip()
+        newatab.ids['almdb'].text = (an[9].strip() if len(an) > 9 else '')
+        newatab.ids['dbabs'].text = (an[10].strip() if len(an) > 10 else '')
+        newatab.ids['dbpct'].text = (an[11].strip() if len(an) > 11 else '')
+        newatab.ids['compdev'].text = (an[12].strip() if len(an) > 12 else '')
+        newatab.ids['cause'].text = (optstr(an, 13) or '')
         if an[8].strip() == 'S':
             newatab.ids['gr'].active = True
         else:
@@ -885,6 +1897,7 @@ class Anatab(TabbedPanelItem):
             self.parent.remove_widget(self)
             if self.id in self.aps:
                 self.aps.pop(int(self.aps.index(self.id)))
+                unregpoint(self.pnt)
                 session.delete(self.pnt)
 
 class Ptab(TabbedPanelItem):
@@ -893,7 +1906,7 @@ class Ptab(TabbedPanelItem):
     ps = ListProperty()
     pnt = ObjectProperty()
 
-    def savepp(self,tag,desc,pinno,pinmo,maxi,mini,unit,*args):
+    def savepp(self,tag,desc,pinno,pinmo,maxi,mini,unit,dbabs,dbpct,*args):
         self.rnamem = self.parent.parent.parent.parent.parent.parent.parent.parent.parent.ids['rname'].text
         if self.rnamem == '':
             hey = Tempop(title = 'Not saved')
@@ -906,23 +1919,20 @@ class Ptab(TabbedPanelItem):
             hey.ids['yo'].text = 'Critical field empty'
             hey.open()
         else:
-            q = session.query(RTU).filter(RTU.RTU_name == self.rnamem).first()
+            q = self.parent.parent.parent.parent.parent.parent.parent.parent.parent.dbrtu()
             self.ps.append(self.id)
-            if q == None:
-                newr = RTU(RTU_name = self.rnamem)
-                session.add(newr)
-                q = session.query(RTU).filter(RTU.RTU_name == self.rnamem).first()
-            newpp = Ppoint(
+            newpp = putpoint(q, 'p',
                         PP_tag = tag,
                         PP_descrip = desc,
                         PP_pinno = int(pinno),
                         PP_pinmo = pinmo,
                         PP_max = int(maxi),
                         PP_min = int(mini),
-                        PP_unit = unit
+                        PP_unit = unit,
+                        PP_dbabs = (float(dbabs) if dbabs != '' else None),
+                        PP_dbpct = (float(dbpct) if dbpct != '' else None)
                         )
-            newpp.rem3 = q
-            session.add(newpp)
+            regpoint(newpp, self.rnamem)
             self.pnt = newpp
             hey = Tempop(title = tag)
             hey.open()
@@ -941,6 +1951,8 @@ class Ptab(TabbedPanelItem):
         newptab.ids['mini'].text = p[3].strip()
         newptab.ids['unit'].text = p[4].strip()
         newptab.ids['pin'].text = p[5].strip()
+        newptab.ids['dbabs'].text = (p[6].strip() if len(p) > 6 else '')
+        newptab.ids['dbpct'].text = (p[7].strip() if len(p) > 7 else '')
         self.parent.add_widget(newptab)
 
     # Changes Ptab to Anatab
@@ -970,6 +1982,7 @@ class Ptab(TabbedPanelItem):
             self.parent.remove_widget(self)
             if self.id in self.ps:
                 self.ps.pop(int(self.ps.index(self.id)))
+                unregpoint(self.pnt)
                 session.delete(self.pnt)
                 q = session.query(Ppoint).all()
 
@@ -1043,16 +2056,9 @@ class Lista(FocusBehavior, CompoundSelectionBehavior, GridLayout):
     def erase(self, node):
         self.remove_widget(node)
         q = session.query(RTU).filter(RTU.RTU_name == node.text).first()
-        ds = session.query(Dpoint).filter(Dpoint.DP_RTUid == q.RTU_id).all()
-        ans = session.query(Apoint).filter(Apoint.AP_RTUid == q.RTU_id).all()
-        ps = session.query(Ppoint).filter(Ppoint.PP_RTUid == q.RTU_id).all()
+        retire(q)
         session.delete(q)
-        for d in ds:
-            session.delete(d)
-        for an in ans:
-            session.delete(an)
-        for p in ps:
-            session.delete(p)
+        unregrtu(node.text)
         self.RTUs.pop(self.RTUs.index(node.text))
 
 # Toggle button to indicate a point mode (Input-Output)
@@ -1144,7 +2150,7 @@ class Portpop(Popup):
         q = session.query(RTU).filter(RTU.RTU_name == self.myrem).first()
         q.RTU_port = self.ids['ptspin1'].text
         session.commit()
-        self.caller.caniscan(myrem)
+        self.caller.askport()
 
 ### Next 5 classes are for display widgets. Each widget contains its type
 ### and an indicator that tells the program if the widget has been assigned
@@ -1180,38 +2186,22 @@ class Blinker(DragBehavior,Widget):
     pinno = StringProperty()
     sbt = StringProperty()
 
-    # Method for changing the color of an input pin if state changes
-    def measure(self):
-        if self.pinmo=='IN':
-            Clock.schedule_interval(partial(self.chcolor, False), 1)
-
     # Method that changes color and state of an output pin on click
     def chstat(self):
         if self.value==1:
-            self.pin.write(0)
             self.value=0
         else:
-            self.pin.write(1)
             self.value=1
+        self.parent.output(self, self.value)
 
-    # Method that detects state changes to raise alarms if indicated
-    def chcolor(self, fst, *args):
-        if not fst:
-            if self.stat != self.pin.read() and self.alarmer:
-                self.parent.rise(self.name, self.value, 'd' , self.desc)
-                if not self.parent.parent.manager.current == 'almsc':
-                    if self.parent.tone2:
-                        self.parent.tone2.play()
-        if self.pin.read() == True:
+    # Method that updates the state of an input pin with the reading given by
+    # the scan engine (see MyLayout.scan)
+    def chcolor(self, rd, *args):
+        if rd == True:
             self.value = 0
-            self.stat = self.pin.read()
         else:
             self.value = 1
-            self.stat = self.pin.read()
-
-    # Clock for scheduling state change detection
-    def end(self,*args):
-        Clock.unschedule(self.chcolor)
+        self.stat = bool(rd)
 
     # Click override. Changes state on output elements and opens the
     # linking popup if double click
@@ -1230,7 +2220,7 @@ class Blinker(DragBehavior,Widget):
                     rs = session.query(RTU).all()
                     DBpop = DBPopup(target_element = self, typ = 'd')
                     for r in rs:
-                        dgs = session.query(Dpoint).filter(Dpoint.DP_RTUid==r.RTU_id).all()
+                        dgs = session.query(Dpoint).filter(Dpoint.DP_RTUid == r.RTU_id, Dpoint.DP_retired == False).all()
                         DBpop.ids['ptspin1'].rvalues[r.RTU_name] = []
                         for dg in dgs:
                             if dg.DP_tag not in self.parent.asspts:
@@ -1261,98 +2251,31 @@ class Ingage(DragBehavior,Widget):
     selectable = BooleanProperty(True)
     # If true eleement's value will be plotted
     graphable = BooleanProperty(False)
-    # List of values to plot
-    plp = ListProperty()
     ass = BooleanProperty(False)
     # User establisehd units
     unit = StringProperty()
     # Indicates if the element is currently on alarm state
     alarming = BooleanProperty(False)
+    # Alarm deadband (hysteresis) in engineering units
+    almdb = NumericProperty()
+    # Report-by-exception deadbands, absolute and percent of the span
+    dbabs = NumericProperty()
+    dbpct = NumericProperty()
+    # Historian compression deviation, 0 for no compression (see Door)
+    compdev = NumericProperty()
     ptyp = StringProperty('a')
     pinno = StringProperty()
     sbt = StringProperty()
 
-    # Method that sets up the plotting area according to the number of plots
+    # Adds the trend pen of the element, scaled to its calibration limits
     def setgraph(self, *args):
         if self.graphable:
-            if self.parent.parent.manager.get_screen('almsc').ids.pl1.text == 'Value 1':
-                self.parent.parent.manager.get_screen('almsc').ids.pl1.text = self.name
-                self.parent.plot.append(MeshLinePlot(color = [0,0,1,1]))
-                self.parent.parent.manager.get_screen('almsc').ids.grafi.add_plot(self.parent.plot[0])
-                if self.ch > self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax:
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax = self.ch + 20
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.y_ticks_major = (self.ch + 20)/10
-            elif self.parent.parent.manager.get_screen('almsc').ids.pl2.text == 'Value 2':
-                self.parent.parent.manager.get_screen('almsc').ids.pl2.text = self.name
-                self.parent.plot.append(MeshLinePlot(color = [0.4,0.2,0.6,1]))
-                self.parent.parent.manager.get_screen('almsc').ids.grafi.add_plot(self.parent.plot[1])
-                if self.ch > self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax:
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax = self.ch + 20
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.y_ticks_major = (self.ch + 20)/10
-            elif self.parent.parent.manager.get_screen('almsc').ids.pl3.text == 'Value 3':
-                self.parent.parent.manager.get_screen('almsc').ids.pl3.text = self.name
-                self.parent.plot.append(MeshLinePlot(color = [0.9,0.9,0.05,1]))
-                self.parent.parent.manager.get_screen('almsc').ids.grafi.add_plot(self.parent.plot[2])
-                if self.ch > self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax:
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax = self.ch + 20
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.y_ticks_major = (self.ch + 20)/10
-            elif self.parent.parent.manager.get_screen('almsc').ids.pl4.text == 'Value 4':
-                self.parent.parent.manager.get_screen('almsc').ids.pl4.text = self.name
-                self.parent.plot.append(MeshLinePlot(color = [0.11,0.95,0.93,1]))
-                self.parent.parent.manager.get_screen('almsc').ids.grafi.add_plot(self.parent.plot[3])
-                if self.ch > self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax:
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax = self.ch + 20
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.y_ticks_major = (self.ch + 20)/10
-
-    # Clock that schedules the method for bar animation
-    def measure(self):
-        Clock.schedule_interval(self.setbar, 1)
-
-    # This method reads the element and adjust the bar animation. Also raises
-    # alarms
-    def setbar(self, *args):
-        if self.pin.read()==None:
-            self.value=0
-        else:
-            a = self.ch-self.cl
-            self.value = (a*self.pin.read())+self.cl
-        if self.graphable:
-            self.plp.append(self.value)
-            self.parent.uplot(self.name,self.plp)
-        self.beep()
-
-    # Compares read values to limits and indicates if an alarm should be raised
-    def beep(self,*args):
-        if self.value >= self.ch:
-            self.alarming = True
-            self.parent.rise(self.name,self.value,'HH',self.desc)
-            if not self.parent.parent.manager.current == 'almsc':
-                    if self.parent.tone3:
-                            self.parent.tone3.play()
-        elif self.value <= self.cl:
-            self.alarming = True
-            self.parent.rise(self.name,self.value,'LL',self.desc)
-    	    if not self.parent.parent.manager.current == 'almsc':
-                if self.parent.tone3:
-                    self.parent.tone3.play()
-        elif self.value < self.l and self.value > self.cl:
-            self.alarming = True
-            self.parent.rise(self.name,self.value,'L', self.desc)
-            if not self.parent.parent.manager.current == 'almsc':
-                if self.parent.tone1:
-                    self.parent.tone1.play()
-        elif self.value > self.h and self.value < self.ch:
-            self.alarming = True
-            self.parent.rise(self.name,self.value,'H',self.desc)
-            if not self.parent.parent.manager.current == 'almsc':
-                if self.parent.tone1:
-                    self.parent.tone1.play()
-        else:
-            self.alarming = False
+            self.parent.parent.manager.get_screen('almsc').ids.ATbox.addpen(self.name, self.cl, self.ch, self.RTU)
 
-    # Stops element scan
-    def end(self,*args):
-        Clock.unschedule(self.setbar)
+    # This method adjusts the bar animation to the value given by the scan
+    # engine (see MyLayout.scan)
+    def setbar(self, val, *args):
+        self.value = val
 
     # Open linking popup on double click
     def on_touch_up(self,touch):
@@ -1368,7 +2291,7 @@ class Ingage(DragBehavior,Widget):
                     rs = session.query(RTU).all()
                     DBpop = DBPopup(target_element = self, typ = 'a')
                     for r in rs:
-                        ans = session.query(Apoint).filter(Apoint.AP_RTUid==r.RTU_id).all()
+                        ans = session.query(Apoint).filter(Apoint.AP_RTUid == r.RTU_id, Apoint.AP_retired == False).all()
                         DBpop.ids['ptspin1'].rvalues[r.RTU_name] = []
                         for an in ans:
                             if an.AP_tag not in self.parent.asspts:
@@ -1395,89 +2318,23 @@ class Ingageh(DragBehavior,Widget):
     sel = BooleanProperty(False)
     selectable = BooleanProperty(True)
     graphable = BooleanProperty(False)
-    plp = ListProperty()
     ass = BooleanProperty(False)
     unit = StringProperty()
     alarming = BooleanProperty(False)
+    almdb = NumericProperty()
+    dbabs = NumericProperty()
+    dbpct = NumericProperty()
+    compdev = NumericProperty()
     ptyp = StringProperty('a')
     pinno = StringProperty()
     sbt = StringProperty()
 
     def setgraph(self, *args):
         if self.graphable:
-            if self.parent.parent.manager.get_screen('almsc').ids.pl1.text == 'Value 1':
-                self.parent.parent.manager.get_screen('almsc').ids.pl1.text = self.name
-                self.parent.plot.append(MeshLinePlot(color = [0,0,1,1]))
-                self.parent.parent.manager.get_screen('almsc').ids.grafi.add_plot(self.parent.plot[0])
-                if self.ch > self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax:
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax = self.ch + 20
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.y_ticks_major = (self.ch + 20)/10
-            elif self.parent.parent.manager.get_screen('almsc').ids.pl2.text == 'Value 2':
-                self.parent.parent.manager.get_screen('almsc').ids.pl2.text = self.name
-                self.parent.plot.append(MeshLinePlot(color = [0.4,0.2,0.6,1]))
-                self.parent.parent.manager.get_screen('almsc').ids.grafi.add_plot(self.parent.plot[1])
-                if self.ch > self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax:
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax = self.ch + 20
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.y_ticks_major = (self.ch + 20)/10
-            elif self.parent.parent.manager.get_screen('almsc').ids.pl3.text == 'Value 3':
-                self.parent.parent.manager.get_screen('almsc').ids.pl3.text = self.name
-                self.parent.plot.append(MeshLinePlot(color = [0.9,0.9,0.05,1]))
-                self.parent.parent.manager.get_screen('almsc').ids.grafi.add_plot(self.parent.plot[2])
-                if self.ch > self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax:
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax = self.ch + 20
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.y_ticks_major = (self.ch + 20)/10
-            elif self.parent.parent.manager.get_screen('almsc').ids.pl4.text == 'Value 4':
-                self.parent.parent.manager.get_screen('almsc').ids.pl4.text = self.name
-                self.parent.plot.append(MeshLinePlot(color = [0.11,0.95,0.93,1]))
-                self.parent.parent.manager.get_screen('almsc').ids.grafi.add_plot(self.parent.plot[3])
-                if self.ch > self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax:
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.ymax = self.ch + 20
-                    self.parent.parent.manager.get_screen('almsc').ids.grafi.y_ticks_major = (self.ch + 20)/10
-
-    def measure(self):
-        Clock.schedule_interval(self.setbar, 60/60.)
-
-    def setbar(self, *args):
-        if self.pin.read()==None:
-            self.value=0
-        else:
-            a = self.ch-self.cl
-            self.value = (a*self.pin.read())+self.cl
-        if self.graphable:
-            self.plp.append(self.value)
-            self.parent.uplot(self.name,self.plp)
-        self.beep()
-
-    def beep(self,*args):
-        if self.value >= self.ch:
-            self.alarming = True
-            self.parent.rise(self.name,self.value,'HH',self.desc)
-            if not self.parent.parent.manager.current == 'almsc':
-                    if self.parent.tone3:
-                            self.parent.tone3.play()
-        elif self.value <= self.cl:
-            self.alarming = True
-            self.parent.rise(self.name,self.value,'LL',self.desc)
-    	    if not self.parent.parent.manager.current == 'almsc':
-                if self.parent.tone3:
-                    self.parent.tone3.play()
-        elif self.value < self.l and self.value > self.cl:
-            self.alarming = True
-            self.parent.rise(self.name,self.value,'L', self.desc)
-            if not self.parent.parent.manager.current == 'almsc':
-                if self.parent.tone1:
-                    self.parent.tone1.play()
-        elif self.value > self.h and self.value < self.ch:
-            self.alarming = True
-            self.parent.rise(self.name,self.value,'H',self.desc)
-            if not self.parent.parent.manager.current == 'almsc':
-                if self.parent.tone1:
-                    self.parent.tone1.play()
-        else:
-            self.alarming = False
+            self.parent.parent.manager.get_screen('almsc').ids.ATbox.addpen(self.name, self.cl, self.ch, self.RTU)
 
-    def end(self,*args):
-        Clock.unschedule(self.setbar)
+    def setbar(self, val, *args):
+        self.value = val
 
     def on_touch_up(self,touch):
         super(Ingageh, self).on_touch_up(touch)
@@ -1492,7 +2349,7 @@ class Ingageh(DragBehavior,Widget):
                     rs = session.query(RTU).all()
                     DBpop = DBPopup(target_element = self, typ = 'a')
                     for r in rs:
-                        ans = session.query(Apoint).filter(Apoint.AP_RTUid==r.RTU_id).all()
+                        ans = session.query(Apoint).filter(Apoint.AP_RTUid == r.RTU_id, Apoint.AP_retired == False).all()
                         DBpop.ids['ptspin1'].rvalues[r.RTU_name] = []
                         for an in ans:
                             if an.AP_tag not in self.parent.asspts:
@@ -1523,20 +2380,18 @@ class Outgage(DragBehavior, Widget):
     cntv = NumericProperty()
     ass = BooleanProperty(False)
     unit = StringProperty()
+    dbabs = NumericProperty()
+    dbpct = NumericProperty()
     ptyp = StringProperty('p')
     pinno = StringProperty()
     sbt = StringProperty()
 
-    # Clock for scheduling control actions
-    def measure(self,*args):
-        Clock.schedule_interval(self.control,60/60.)
-
-    # Writes current value to linked point
+    # Writes current value to linked point (see MyLayout.output)
     def control(self, *args):
         a = self.ids['cnt'].max-self.ids['cnt'].min
         self.val = (self.ids['cnt'].value-self.ids['cnt'].min)/a
         if not self.parent.ftrun:
-            self.pin.write(self.val)
+            self.parent.output(self, self.val)
 
     # Opens linking popup
     def on_touch_down(self,touch):
@@ -1553,7 +2408,7 @@ class Outgage(DragBehavior, Widget):
                     rs = session.query(RTU).all()
                     DBpop = DBPopup(target_element = self, typ = 'p')
                     for r in rs:
-                        ps = session.query(Ppoint).filter(Ppoint.PP_RTUid==r.RTU_id).all()
+                        ps = session.query(Ppoint).filter(Ppoint.PP_RTUid == r.RTU_id, Ppoint.PP_retired == False).all()
                         DBpop.ids['ptspin1'].rvalues[r.RTU_name] = []
                         for p in ps:
                             if p.PP_tag not in self.parent.asspts:
@@ -1572,9 +2427,6 @@ class Outgage(DragBehavior, Widget):
         else:
             super(Outgage, self).on_touch_move(touch)
 
-    def end(self,*args):
-        Clock.unschedule(self.control)
-
 # Horizontal bar
 class Outgageh(DragBehavior, Widget):
     name=StringProperty()
@@ -1591,18 +2443,17 @@ class Outgageh(DragBehavior, Widget):
     cntv = NumericProperty()
     ass = BooleanProperty(False)
     unit = StringProperty()
+    dbabs = NumericProperty()
+    dbpct = NumericProperty()
     ptyp = StringProperty('p')
     pinno = StringProperty()
     sbt = StringProperty()
 
-    def measure(self,*args):
-        Clock.schedule_interval(self.control,60/60.)
-
     def control(self, *args):
         a= self.ids['cnt'].max-self.ids['cnt'].min
         self.val = (self.ids['cnt'].value-self.ids['cnt'].min)/a
         if not self.parent.ftrun:
-            self.pin.write(self.val)
+            self.parent.output(self, self.val)
 
     def on_touch_down(self,touch):
         if self.ids['cnt'].collide_point(touch.x, touch.y) and not self.parent.running:
@@ -1618,7 +2469,7 @@ class Outgageh(DragBehavior, Widget):
                     rs = session.query(RTU).all()
                     DBpop = DBPopup(target_element = self, typ = 'p')
                     for r in rs:
-                        ps = session.query(Ppoint).filter(Ppoint.PP_RTUid==r.RTU_id).all()
+                        ps = session.query(Ppoint).filter(Ppoint.PP_RTUid == r.RTU_id, Ppoint.PP_retired == False).all()
                         DBpop.ids['ptspin1'].rvalues[r.RTU_name] = []
                         for p in ps:
                             if p.PP_tag not in self.parent.asspts:
@@ -1635,9 +2486,6 @@ class Outgageh(DragBehavior, Widget):
         else:
             super(Outgageh, self).on_touch_move(touch)
 
-    def end(self,*args):
-        Clock.unschedule(self.control)
-
 # Draggable textbox
 class Textbox(TextInput):
     selectable = BooleanProperty(True)
@@ -1658,8 +2506,7 @@ class DBPopup(Popup):
     def save(self):
         # linking of digital widget
         if self.typ == 'd':
-            r_info = session.query(RTU).filter(RTU.RTU_name==self.ids['rspin'].text).first()
-            p_info = session.query(Dpoint).filter(Dpoint.DP_RTUid == r_info.RTU_id, Dpoint.DP_tag == self.ids['ptspin1'].text).one()
+            p_info = points[('d', self.ids['rspin'].text, self.ids['ptspin1'].text)]
             self.target_element.RTU = self.ids['rspin'].text
             self.target_element.pinmo = p_info.DP_pinmo
             self.target_element.pinno = str(p_info.DP_pinno)
@@ -1671,8 +2518,7 @@ class DBPopup(Popup):
             self.target_element.parent.asspts.append(p_info.DP_tag)
         # linking of analogic input widget
         elif self.typ == 'a':
-            r_info = session.query(RTU).filter(RTU.RTU_name==self.ids['rspin'].text).first()
-            p_info = session.query(Apoint).filter(Apoint.AP_RTUid==r_info.RTU_id,Apoint.AP_tag==self.ids['ptspin1'].text).first()
+            p_info = points[('a', self.ids['rspin'].text, self.ids['ptspin1'].text)]
             self.target_element.RTU = self.ids['rspin'].text
             self.target_element.desc= p_info.AP_descrip
             self.target_element.pinmo = p_info.AP_pinmo
@@ -1681,15 +2527,14 @@ class DBPopup(Popup):
             self.target_element.cl = float(p_info.AP_clowlimit)
             self.target_element.h = float(p_info.AP_hilimit)
             self.target_element.l = float(p_info.AP_lowlimit)
-            self.target_element.graphable = p_info.AP_graph
-            if self.target_element.graphable and not self.target_element.parent.parent.manager.get_screen('almsc').ids.gtog1.active:
-                self.target_element.parent.parent.manager.get_screen('almsc').ids.gtog1.active = True
-            elif not self.target_element.parent.parent.manager.get_screen('almsc').ids.gtog2.active:
-                self.target_element.parent.parent.manager.get_screen('almsc').ids.gtog2.active = True
-            elif not self.target_element.parent.parent.manager.get_screen('almsc').ids.gtog3.active:
-                self.target_element.parent.parent.manager.get_screen('almsc').ids.gtog3.active = True
+            if p_info.AP_almdb == None:
+                self.target_element.almdb = ALMDB * (self.target_element.ch - self.target_element.cl)
             else:
-                self.target_element.parent.parent.manager.get_screen('almsc').ids.gtog4.active = True
+                self.target_element.almdb = float(p_info.AP_almdb)
+            self.target_element.dbabs = float(p_info.AP_dbabs or 0)
+            self.target_element.dbpct = float(p_info.AP_dbpct or 0)
+            self.target_element.compdev = float(p_info.AP_compdev or 0)
+            self.target_element.graphable = p_info.AP_graph
             self.target_element.unit = p_info.AP_unit
             self.target_element.name = self.ids['ptspin1'].text
             self.target_element.value = 0
@@ -1698,8 +2543,8 @@ class DBPopup(Popup):
             self.target_element.parent.asspts.append(p_info.AP_tag)
         # Analogic output widget linking
         elif self.typ == 'p':
-            r_info = session.query(RTU).filter(RTU.RTU_name==self.ids['rspin'].text).first()
-            p_info = session.query(Ppoint).filter(Ppoint.PP_RTUid==r_info.RTU_id,Ppoint.PP_tag==self.ids['ptspin1'].text).first()
+            p_info = points[('p', self.ids['rspin'].text, self.ids['ptspin1'].text)]
+            self.target_element.RTU = self.ids['rspin'].text
             self.target_element.desc= p_info.PP_descrip
             self.target_element.pinmo = p_info.PP_pinmo
             self.target_element.pinno = str(p_info.PP_pinno)
@@ -1707,6 +2552,8 @@ class DBPopup(Popup):
             self.target_element.ids['cnt'].min= p_info.PP_min
             self.target_element.name = self.ids['ptspin1'].text
             self.target_element.unit = p_info.PP_unit
+            self.target_element.dbabs = float(p_info.PP_dbabs or 0)
+            self.target_element.dbpct = float(p_info.PP_dbpct or 0)
             self.target_element.ass = True
             self.target_element.parent.asspts.append(p_info.PP_tag)
             self.target_element.control()
@@ -1739,10 +2586,12 @@ class Toolbar(GridLayout):
 # MyLayout is the core of the HMI. It manages animations, plotting and alarms
 # All existing widgets on a display are children to this object
 class MyLayout(Widget, CompoundSelectionBehavior):
-    # Present remotes list (as pyFirmata objects)
-    ard = ListProperty()
-    # Iterator for pyFirmata
-    it = ListProperty()
+    # Present remotes (name: RTUWorker)
+    ard = ObjectProperty()
+    # Readings of all the remotes, filled by their workers
+    snap = ObjectProperty()
+    # Remotes waiting for a port to be assigned
+    pending = ListProperty()
     # Indicates if a scan is initiated
     running = BooleanProperty(False)
     # Current time and date for display
@@ -1756,25 +2605,59 @@ class MyLayout(Widget, CompoundSelectionBehavior):
     selmn = BooleanProperty(False)
     # Initial position of a draggable widget
     st = ListProperty()
-    # Plots for the trends screen
-    plot = ListProperty()
-    # Points for the plots
+    # Samples of the trended tags ((remote, tag): Ring)
     toplot = ObjectProperty()
+    # Number of samples kept for each trend of the display
+    trcap = NumericProperty(TRCAP)
+    # Samples appended and plot width of each trend when it was last drawn
+    drawn = ObjectProperty()
     # Alarm sounds
     tone1 = ObjectProperty()
     tone2 = ObjectProperty()
     tone3 = ObjectProperty()
+    # Time and priority of the last alarm sound played
+    toned = NumericProperty(0)
+    tonep = NumericProperty(3)
     # linked points list
     asspts = ListProperty()
     # List of linked widgets
     toscan = ListProperty()
     # Indicates if scan is running for the first time
-    ftrun = BooleanProperty()
+    ftrun = BooleanProperty(True)
     myrem = StringProperty()
+    # Scan period of the display in seconds
+    scanp = NumericProperty(1)
+    # Digital input elements by (remote, tag) and their last readings
+    dins = ObjectProperty()
+    table = ObjectProperty()
+    # Analog input elements, evaluated against their limits on each scan
+    anas = ListProperty()
+    # Limits of the analog input elements (see Limits)
+    lims = ObjectProperty()
+    # Historian: (element, point key, deadband) of each linked element, last
+    # value written of each point key and readings waiting to be written
+    hpts = ListProperty()
+    hlast = ObjectProperty()
+    # Point key of every element linked for the historian
+    hkeys = ObjectProperty()
+    # Time of the last reading buffered of each point key (see keep)
+    htms = ObjectProperty()
+    # Last reading held back by the deadband of each point key (see change)
+    hprev = ObjectProperty()
+    # Epoch time of the last reading of each analog input, by (remote, tag)
+    tms = ObjectProperty()
+    # Historian compression of the points that have it, by point key (see Door)
+    doors = ObjectProperty()
+    hist = ListProperty()
+    # Epoch time of the first scan, origin of the x axis of the live trends
+    tstart = NumericProperty(0)
 
     # On init, toplot is declared as a dict and date/time are displayed
     def __init__(self, **kwargs):
         self.toplot = {}
+        self.drawn = {}
+        self.ard = {}
+        self.snap = Snapshot()
         Clock.schedule_interval(self.settime, 1)
         super(MyLayout, self).__init__(**kwargs)
 
@@ -2024,16 +2907,35 @@ class MyLayout(Widget, CompoundSelectionBehavior):
             hey.open()
         else:
             if self.ftrun:
-                newppop = Portpop(caller = self, myrem = q.RTU_name)
-                newppop.open()
+                self.pending = []
+                for kid in self.children:
+                    try:
+                        if kid.ass and kid.RTU not in self.pending:
+                            self.pending.append(kid.RTU)
+                    except: continue
+                self.askport()
             else:
-                self.caniscan(q.RTU_name)
+                self.caniscan()
+
+    # Opens the port selection popup of the next remote without port, starts
+    # the scan when all of them are assigned
+    def askport(self, *args):
+        if len(self.pending) > 0:
+            newppop = Portpop(caller = self, myrem = self.pending.pop(0))
+            newppop.open()
+        else:
+            self.caniscan()
 
     # Method to check if running conditions are met
-    def caniscan(self, myrem, *args):
+    def caniscan(self, *args):
         if not self.running:
             gels = 0
             assels = 0
+            self.toscan = []
+            if self.ids['scanp'].text != '' and float(self.ids['scanp'].text) > 0:
+                self.scanp = float(self.ids['scanp'].text)
+            if self.ids['trcap'].text != '' and int(float(self.ids['trcap'].text)) > 0:
+                self.trcap = int(float(self.ids['trcap'].text))
             for kid in self.children:
                 try:
                     if kid.ass:
@@ -2044,37 +2946,162 @@ class MyLayout(Widget, CompoundSelectionBehavior):
                 except: continue
             self.mklog()
             if assels > 0 and gels > 0 and self.ftrun:
-                self.setcomm(True, myrem)
+                self.setcomm(True)
             elif assels > 0 and gels == 0 and self.ftrun:
-                self.setcomm(False, myrem)
+                self.setcomm(False)
             else:
                 self.startall()
                 self.startgraph()
 
-    def setcomm(self, gr, myrem, *args):
-        if self.ard == []:
-            r_info = session.query(RTU).filter(RTU.RTU_name == myrem).first()
-            self.ard.append(Arduino(r_info.RTU_port))
-            self.it.append(util.Iterator(self.ard[0]))
-            self.it[0].start()
+    # Starts one I/O worker per remote linked on the display. Boards take a
+    # few seconds to open, so the scan starts when all of them are ready
+    def setcomm(self, gr, *args):
         for kid in self.toscan:
-            kid.pin = self.ard[0].get_pin('{0}:{1}:{2}'.format(kid.ptyp,kid.pinno,kid.pinmo[0].lower()))
+            if kid.RTU not in self.ard:
+                r_info = session.query(RTU).filter(RTU.RTU_name == kid.RTU).first()
+                self.ard[kid.RTU] = RTUWorker(kid.RTU, r_info.RTU_port, self.snap)
+                self.ard[kid.RTU].sampling = (r_info.RTU_sampling or 0)
+                self.ard[kid.RTU].linked = (r_info.RTU_linked != False)
+                self.ard[kid.RTU].wrate = (WRATE if r_info.RTU_wrate == None else r_info.RTU_wrate)
+            self.ard[kid.RTU].defs[kid.name] = '{0}:{1}:{2}'.format(kid.ptyp,kid.pinno,kid.pinmo[0].lower())
+        for wk in self.ard.values():
+            if not wk.is_alive() and not wk.ready.is_set():
+                wk.start()
+        Clock.schedule_interval(partial(self.waitcomm, gr), 0.5)
+
+    # Links the pins to the widgets once every remote is ready
+    def waitcomm(self, gr, *args):
+        for wk in self.ard.values():
+            if not wk.ready.is_set():
+                return
+        for wk in self.ard.values():
+            if wk.error != '':
+                hey = Tempop(title = 'Error')
+                hey.ids['yo'].text = 'Cannot open ' + wk.rem
+                hey.open()
+                self.ard.pop(wk.rem)
+                return False
+        for kid in self.toscan:
+            kid.pin = self.ard[kid.RTU].pins[kid.name]
         self.startall()
         if gr:
             self.startgraph()
+        return False
 
     # Method that starts firmata queries and animations
     def startall(self, *args):
         self.running = True
         self.ftrun = False
+        self.table = {}
+        self.tms = {}
+        self.dins = {}
+        self.anas = []
         for kid in self.toscan:
-            kid.measure()
+            if kid.ptyp == 'a':
+                self.anas.append(kid)
+            elif kid.ptyp == 'd' and kid.pinmo != 'OUT':
+                self.dins[(kid.RTU, kid.name)] = kid
             kid.drag_distance = 0
             kid.drag_rectangle = 0,0,0,0
             kid.slide = False
-        Clock.schedule_interval(self.savetodb, 5)
+        self.lims = Limits(self.anas)
+        if not self.tstart:
+            self.tstart = stamp()
+        for kid in self.anas:
+            if kid.graphable and ((kid.RTU, kid.name) not in self.toplot or len(self.toplot[(kid.RTU, kid.name)].buf) != self.trcap):
+                self.toplot[(kid.RTU, kid.name)] = Ring(self.trcap)
+        self.resolve()
+        Clock.schedule_interval(self.scan, self.scanp)
+        Clock.schedule_interval(self.edges, 0)
+        Clock.schedule_interval(self.savetodb, SAMPLEP)
+        Clock.schedule_interval(self.flush, FLUSHP)
         self.canvas.after.remove(self.touches)
 
+    # Scan engine. A single clock per display that:
+    # 1 - Takes the readings of every linked point from the remotes snapshot
+    # 2 - Pushes the reading only to the widgets whose value changed (by more
+    #     than their deadband, see rbedb)
+    # 3 - Writes the analog outputs and updates the trends
+    # 4 - Evaluates the alarm limits of all analog inputs at once
+    # Digital inputs don't wait for the scan, see edges
+    def scan(self, *args):
+        vals, tms = self.snap.get()
+        for kid in self.toscan:
+            if kid.ptyp == 'p':
+                kid.control()
+        avs = self.lims.scale(np.array([vals.get((kid.RTU, kid.name)) for kid in self.anas], dtype = float))
+        now = stamp()
+        # Every reading keeps its time, changed or not, for the historian and
+        # the alarms
+        for kid in self.anas:
+            self.tms[(kid.RTU, kid.name)] = tms.get((kid.RTU, kid.name), now)
+        for i in self.lims.report(avs):
+            kid = self.anas[i]
+            kid.setbar(float(avs[i]))
+            if kid.graphable:
+                self.toplot[(kid.RTU, kid.name)].append(kid.value, self.tms[(kid.RTU, kid.name)])
+        self.lims.vals = avs
+        self.evalim()
+
+    # Queues a write of an output element on the worker of its remote
+    def output(self, kid, val):
+        if kid.RTU in self.ard:
+            self.ard[kid.RTU].write(kid.name, val)
+
+    # Takes the changes of the digital inputs posted by the remote workers on
+    # every frame, in the order they arrived. The first reading of an input
+    # only sets its state, the next ones raise its alarm. Changes go to the
+    # historian with the time they arrived
+    def edges(self, *args):
+        q = self.snap.edges
+        while q:
+            tm, rem, tag, rd = q.popleft()
+            kid = self.dins.get((rem, tag))
+            if kid == None:
+                continue
+            if self.table.get((rem, tag)) != None and kid.alarmer:
+                if self.rise(kid.name, kid.value, 'd', kid.desc, kid.RTU, tm):
+                    self.annunciate('d')
+                self.clearalm(kid.name, kid.RTU, tm)
+            self.table[(rem, tag)] = rd
+            kid.chcolor(rd)
+            key = self.hkeys.get(kid)
+            if key != None:
+                self.change(key, int(tm * 1000), float(kid.value))
+
+    # Compares the values of every analog input to its limits at once and
+    # raises or clears the alarms of the points that changed alarm state
+    def evalim(self, *args):
+        chg, st = self.lims.evaluate()
+        for i in chg:
+            kid = self.anas[i]
+            typ = Limits.names[int(st[i])]
+            kid.alarming = typ != ''
+            if kid.alarming:
+                if self.rise(kid.name, kid.value, typ, kid.desc, kid.RTU, self.tms.get((kid.RTU, kid.name))):
+                    self.annunciate(typ)
+            else:
+                self.clearalm(kid.name, kid.RTU, self.tms.get((kid.RTU, kid.name)))
+
+    # Plays the alarm sound of the event type if the alarms screen is not
+    # being displayed, no more than once every TONEP seconds unless the event
+    # has a higher priority than the last one played
+    def annunciate(self, typ, *args):
+        if self.parent.manager.current == 'almsc':
+            return
+        if stamp() - self.toned < TONEP and PRIOS.get(typ, 3) >= self.tonep:
+            return
+        self.toned = stamp()
+        self.tonep = PRIOS.get(typ, 3)
+        if typ == 'HH' or typ == 'LL':
+            tone = self.tone3
+        elif typ == 'd':
+            tone = self.tone2
+        else:
+            tone = self.tone1
+        if tone:
+            tone.play()
+
     # Method that updates date and time in real time
     def settime(self,*args):
         self.rtime = time.strftime('%H:%M:%S')
@@ -2084,9 +3111,13 @@ class MyLayout(Widget, CompoundSelectionBehavior):
     def stahp(self,*args):
         if self.running:
             self.running = False
-            for kid in self.toscan:
-                kid.end()
+            Clock.unschedule(self.scan)
+            Clock.unschedule(self.edges)
             Clock.unschedule(self.savetodb)
+            Clock.unschedule(self.flush)
+            self.shut()
+            self.flush()
+            closeroll()
             self.startgraph()
         else:
             pass
@@ -2098,26 +3129,33 @@ class MyLayout(Widget, CompoundSelectionBehavior):
             try: kid.restart()
             except: continue
 
-    # Raises an alarm
-    def rise(self, tag, val, typ, des):
+    # Raises an alarm, tm being the epoch time of the event if not now.
+    # Returns if it must be announced (see Alarms.newalm)
+    def rise(self, tag, val, typ, des, rem, tm = None):
         self.ids['almb'].y = 30
-        self.parent.manager.get_screen('almsc').ids.alms.newalm(tag,val,typ,self.rtime, des)
+        return self.parent.manager.get_screen('almsc').ids.alms.newalm(tag,val,typ,(stamp() if tm == None else tm), des, rem)
 
-    # Real-time plot update
-    def uplot(self,tag,vals,*args):
-        self.toplot[tag] = vals
+    # Informs that the point is back to normal, tm being the epoch time of the
+    # event if not now
+    def clearalm(self, tag, rem, tm = None):
+        self.parent.manager.get_screen('almsc').ids.alms.clear((rem, tag), tm)
 
-    # Sends points contained in toplot for plotting
+    # Sends points contained in toplot for plotting, x being the seconds since
+    # the first scan. Only the trends with new samples are drawn, decimated
+    # to the width of the plot (see decimate).
+    # Nothing is done while the historic trends are displayed (see PlotArea)
     def plotel(self,*args):
-        for key in self.toplot:
-            if key == self.parent.manager.get_screen('almsc').ids.pl1.text and self.parent.manager.get_screen('almsc').ids.gtog1.active:
-                self.plot[0].points = [(i,j) for i, j in enumerate(self.toplot[key])]
-            elif key == self.parent.manager.get_screen('almsc').ids.pl2.text and self.parent.manager.get_screen('almsc').ids.gtog2.active:
-                self.plot[1].points = [(i,j) for i, j in enumerate(self.toplot[key])]
-            elif key == self.parent.manager.get_screen('almsc').ids.pl3.text and self.parent.manager.get_screen('almsc').ids.gtog3.active:
-                self.plot[2].points = [(i,j) for i, j in enumerate(self.toplot[key])]
-            elif key == self.parent.manager.get_screen('almsc').ids.pl4.text and self.parent.manager.get_screen('almsc').ids.gtog4.active:
-                self.plot[3].points = [(i,j) for i, j in enumerate(self.toplot[key])]
+        almsc = self.parent.manager.get_screen('almsc')
+        if almsc.ids.ATbox.window:
+            return
+        w = max(int(almsc.ids.grafi.width), 1)
+        for pk, pen in almsc.ids.ATbox.pens.items():
+            rg = self.toplot.get(pk)
+            if rg == None or not pen.ids['chk'].active:
+                continue
+            if self.drawn.get(pk) != (rg.n, w):
+                pen.plot.points = decimate(rg.times() - self.tstart, pen.scale(rg.values()), w)
+                self.drawn[pk] = (rg.n, w)
 
     # Clocks for plotting: Plotting, x-axis labels update and range expansion
     def startgraph(self):
@@ -2131,72 +3169,98 @@ class MyLayout(Widget, CompoundSelectionBehavior):
             Clock.unschedule(self.parent.manager.get_screen('almsc').ids.ATbox.expand)
             self.parent.manager.get_screen('almsc').ids.ATbox.plotting = False
 
-    # Writes readings each minute to database
+    # Resolves the point id of every linked element for the historian
+    def resolve(self, *args):
+        ids = pointids()
+        self.hpts = []
+        self.hlast = {}
+        self.hist = []
+        self.doors = {}
+        self.hkeys = {}
+        self.htms = {}
+        self.hprev = {}
+        for kid in self.toscan:
+            pid = ids.get((kid.ptyp, kid.RTU, kid.name))
+            if kid.selectable and pid != None:
+                self.hpts.append((kid, pkey(kid.ptyp, pid), rbedb(kid)))
+                self.hkeys[kid] = pkey(kid.ptyp, pid)
+                if kid.ptyp == 'a' and kid.compdev > 0:
+                    self.doors[pkey('a', pid)] = Door(kid.compdev)
+
+    # Buffers a reading of every linked element whose value changed by more
+    # than its deadband since it was last written (see rbedb), with the time
+    # it was taken for the analog inputs. Compressed points skip the deadband,
+    # every reading goes through their compression (see Door), which bounds
+    # the error of the stored readings by itself
     def savetodb(self, *args):
-        rinfo = session.query(RTU).first()
-        stime = self.rtime
-        for kid in self.children:
-            try:
-                if kid.selectable:
-                    dinfo = session.query(Dpoint).filter(Dpoint.DP_RTUid == rinfo.RTU_id, Dpoint.DP_tag == kid.name).first()
-                    ainfo = session.query(Apoint).filter(Apoint.AP_RTUid == rinfo.RTU_id, Apoint.AP_tag == kid.name).first()
-                    pinfo = session.query(Ppoint).filter(Ppoint.PP_RTUid == rinfo.RTU_id, Ppoint.PP_tag == kid.name).first()
-                    if ainfo == None and pinfo == None:
-                        dread = Pread(PR_val = kid.value, PR_typ = 'd', PR_time = stime)
-                        dread.Rdp = dinfo
-                        session.add(dread)
-                    elif dinfo == None and pinfo == None:
-                        aread = Pread(PR_val = kid.value, PR_typ = 'a', PR_time = stime)
-                        aread.Rap = ainfo
-                        session.add(aread)
-                    elif dinfo == None and ainfo == None:
-                        pmread = Pread(PR_val = kid.ids['cnt'].value, PR_typ = 'p', PR_time = stime)
-                        pmread.Rpp = pinfo
-                        session.add(pmread)
-            except: continue
-        session.commit()
+        now = stamp()
+        for kid, key, db in self.hpts:
+            val = float(kid.ids['cnt'].value if kid.ptyp == 'p' else kid.value)
+            ms = int(self.tms.get((kid.RTU, kid.name), now) * 1000)
+            if key in self.doors:
+                for tm, v in self.doors[key].add(ms, val):
+                    self.keep(key, tm, v)
+                continue
+            if key in self.hlast and abs(val - self.hlast[key]) <= db:
+                self.hprev[key] = (ms, val)
+                continue
+            self.change(key, ms, val)
+
+    # Buffers a reading that passed the deadband, after the last one held
+    # back before it. Stored readings are interpolated when read, so keeping
+    # that one (exception and previous value) keeps flat stretches flat
+    def change(self, key, ms, val):
+        prev = self.hprev.pop(key, None)
+        if prev != None and prev[0] < ms:
+            self.keep(key, prev[0], prev[1])
+        self.hlast[key] = val
+        self.keep(key, ms, val)
+
+    # Buffers a reading of a point key. Its times are kept strictly
+    # increasing, as the readings of a point share the time only once stored
+    # (e.g. the edges of a bouncing contact read in the same millisecond)
+    def keep(self, key, ms, val):
+        ms = max(ms, self.htms.get(key, ms - 1) + 1)
+        self.htms[key] = ms
+        self.hist.append({'PR_time': ms, 'PR_pnt': key, 'PR_val': val})
+
+    # Buffers the readings held by the compression and the deadband of the
+    # points, so the stored readings reach the last one taken
+    def shut(self, *args):
+        for key, (tm, v) in (self.hprev or {}).items():
+            self.keep(key, tm, v)
+        self.hprev = {}
+        for key, door in (self.doors or {}).items():
+            for tm, v in door.close():
+                self.keep(key, tm, v)
+
+    # Writes the buffered readings to the database in bulk (see store). A
+    # failed write is rolled back and its readings dropped, so the scan goes on
+    def flush(self, *args):
+        rows = self.hist
+        self.hist = []
+        try:
+            self.parent.manager.get_screen('almsc').ids.alms.flushlog()
+            if rows:
+                store(rows)
+        except SQLAlchemyError:
+            session.rollback()
+            hey = Tempop(title = 'Error')
+            hey.ids['yo'].text = 'Readings not saved'
+            hey.open()
+            return
+        if rows:
+            # Historic trends get the new data
+            self.parent.manager.get_screen('almsc').ids.ATbox.refresh(min(rw['PR_time'] for rw in rows))
 
     # Opens read reporting popup
     def repop(self, *args):
         rep = Savepop(caller = self, preporter = True)
         rep.open()
 
-    # Generates readings report
-    def reportrd(self, txt, *args):
-        if not txt.endswith('.txt'):
-            txt = txt + '.txt'
-        if os.path.isfile(os.getcwd() + '/Reports/' + txt):
-            nope = Tempop(title = 'Error')
-            nope.ids['yo'].text = 'Duplicated file name'
-            nope.open()
-        else:
-            rdrp = OrderedDict()
-            rpfl = open(os.getcwd() + '/Reports/' + txt, 'w+')
-            reads = session.query(Pread).all()
-            for read in reads:
-                if read.PR_time not in rdrp.keys():
-                    rdrp[read.PR_time] = []
-            for key in rdrp.keys():
-                for read in reads:
-                    if read.PR_time == key:
-                        if read.PR_typ == 'd':
-                            dtag = session.query(Dpoint).filter(Dpoint.DP_id == read.PR_dpointid).first().DP_tag
-                            rdrp[key].append((read.PR_val, dtag))
-                        elif read.PR_typ == 'a':
-                            atag = session.query(Apoint).filter(Apoint.AP_id == read.PR_apointid).first().AP_tag
-                            rdrp[key].append((read.PR_val, atag))
-                        elif read.PR_typ == 'p':
-                            ptag = session.query(Ppoint).filter(Ppoint.PP_id == read.PR_ppointid).first().PP_tag
-                            rdrp[key].append((read.PR_val, ptag))
-            for key, values in rdrp.items():
-                rpfl.write(key + '\r')
-                for value in values:
-                    rpfl.write(value[1] + ', ' + str(value[0]) + '; ')
-                rpfl.write('\r\n')
-            rpfl.close()
-            hey = Tempop(title = 'Success')
-            hey.ids['yo'].text = 'Report created'
-            hey.open()
+    # Generates readings report (see mkreport)
+    def reportrd(self, txt, frm = '', to = '', tgs = '', fmt = 'txt', stp = '', *args):
+        mkreport(txt, frm, to, tgs, fmt, False, stp)
 
     # Opens background image selector
     def bgpop(self, *args):
@@ -2211,14 +3275,21 @@ class MyLayout(Widget, CompoundSelectionBehavior):
     # Makes logs, which are used to reload displays
     def mklog(self):
         self.parent.manager.get_screen('dbsc').export(self.ids['dpname'].text + '_autolog', False, self.ids['remsel'].text)
+        rems = [self.ids['remsel'].text]
+        for kid in self.toscan:
+            if kid.RTU not in rems:
+                rems.append(kid.RTU)
+                self.parent.manager.get_screen('dbsc').export(self.ids['dpname'].text + '_' + kid.RTU + '_autolog', False, kid.RTU)
         fl = open(os.getcwd() + '\Displays\\' + self.ids['dpname'].text + '.txt', 'w+')
-        fl.write(self.ids['dpname'].text + '-' + self.myrem + '\r\n')
+        fl.write(self.ids['dpname'].text + '-' + self.myrem + '-' + str(self.scanp) + '-' + str(self.trcap) + '\r\n')
         for kid in self.toscan:
-            fl.write(kid.ptyp + ',' +  kid.sbt + ',' + kid.name + ',' + str(kid.x) + ',' + str(kid.y) + ';' + '\r\n')
+            fl.write(kid.ptyp + ',' +  kid.sbt + ',' + kid.name + ',' + str(kid.x) + ',' + str(kid.y) + ',' + kid.RTU + ';' + '\r\n')
         fl.close()
 
     def loaddp(self, fl):
         dp = open(os.getcwd() + '/Displays/' + fl + '.txt')
+        # Remotes already loaded
+        rems = []
         for line in dp:
             if ',' not in line and not line == '\n':
                 fln = line.rstrip().split('-')
@@ -2227,27 +3298,39 @@ class MyLayout(Widget, CompoundSelectionBehavior):
                 q = session.query(RTU).filter(RTU.RTU_name == fln[1]).first()
                 self.ids['dpname'].text = fln[0]
                 self.ids['remsel'].text = fln[1]
+                rems.append(fln[1])
+                if len(fln) > 2:
+                    self.ids['scanp'].text = fln[2]
+                if len(fln) > 3:
+                    self.ids['trcap'].text = fln[3]
             else:
                 wds = line.rstrip().split(',')
+                rn = q.RTU_name
+                if len(wds) > 5:
+                    rn = wds[5].rstrip(';')
+                    if rn not in rems:
+                        ldp = Chpop(caller = self.parent.manager.get_screen('dbsc'))
+                        ldp.load([os.getcwd() + '/Reports/' + fln[0] + '_' + rn + '_autolog.txt'])
+                        rems.append(rn)
                 if wds[0] == 'd':
                     nbl = self.newblinker(wds[1], wds[2], float(wds[3]), float(wds[4].rstrip(';')))
                     self.add_widget(nbl)
-                    asv = DBPopup(target_element = nbl, yp = wds[0])
-                    asv.ids['rspin'].values.append(q.RTU_name)
+                    asv = DBPopup(target_element = nbl, typ = wds[0])
+                    asv.ids['rspin'].values.append(rn)
                     asv.ids['ptspin1'].text = wds[2]
                     asv.save()
                 elif wds[0] == 'a':
                     nig = self.newigage(wds[1], wds[2], float(wds[3]), float(wds[4].rstrip(';')))
                     self.add_widget(nig)
-                    asv = DBPopup(target_element = nig, yp = wds[0])
-                    asv.ids['rspin'].values.append(q.RTU_name)
+                    asv = DBPopup(target_element = nig, typ = wds[0])
+                    asv.ids['rspin'].values.append(rn)
                     asv.ids['ptspin1'].text = wds[2]
                     asv.save()
                 elif wds[0] == 'p':
                     nog = self.newogage(wds[1], wds[2], float(wds[3]), float(wds[4].rstrip(';')))
                     self.add_widget(nog)
                     asv = DBPopup(target_element = nog, typ = wds[0])
-                    asv.ids['rspin'].values.append(q.RTU_name)
+                    asv.ids['rspin'].values.append(rn)
                     asv.ids['ptspin1'].text = wds[2]
                     asv.save()
 
@@ -2260,114 +3343,288 @@ class AlarmScreen(Screen):
         alport = Savepop(caller = self, areporter = True)
         alport.open()
 
-    def reportal(self, txt, *args):
-        if not txt.endswith('.txt'):
-            txt = txt + '.txt'
-        if os.path.isfile(os.getcwd() + '/Reports/' + txt):
-            nope = Tempop(title = 'Error')
-            nope.ids['yo'].text = 'Duplicated file name'
-            nope.open()
+    # Generates alarms report (see mkreport)
+    def reportal(self, txt, frm = '', to = '', tgs = '', fmt = 'txt', *args):
+        self.ids.alms.flushlog()
+        mkreport(txt, frm, to, tgs, fmt, True)
+
+# Priority of each alarm event, 1 being the highest, and events shown by each
+# option of the priority filter of the alarm list
+PRIOS = {'HH': 1, 'LL': 1, 'H': 2, 'L': 2, 'd': 3}
+PRIOF = OrderedDict([('All', (1, 2, 3)), ('HH/LL', (1,)), ('H/L', (2,)), ('State', (3,))])
+
+# Alarm management. More than FLOODN alarms within FLOODWIN seconds is a flood.
+# While it lasts the alarms with lower priority than the one kept (see FLOODF)
+# are suppressed: they are journaled as such, not announced and stay hidden
+# until the flood ends. Alarms of a point with a cause (see Apoint) raised
+# while the alarm of the cause is active are consequential, suppressed the
+# same way until the cause goes back to normal. Shelved tags stay hidden and
+# silent until their shelving (see SHELVES) expires. Tones play at most once
+# every TONEP seconds, unless the new alarm has a higher priority than the
+# last one played
+FLOODN = 10
+FLOODWIN = 60
+FLOODF = OrderedDict([('Keep all', 3), ('Keep HH/LL, H/L', 2), ('Keep HH/LL', 1)])
+SHELVES = OrderedDict([('15 min', 900), ('1 h', 3600), ('8 h', 28800)])
+TONEP = 10
+
+# Alarm list. Each tag follows the alarm states:
+# normal -> unack (active, not acknowledged) -> ack (active, acknowledged)
+# and, if it goes back to normal before being acknowledged, clear (not active,
+# not acknowledged). Only the transitions are written to the database.
+# The alarms are kept in memory, one per (remote, tag), and shown through a
+# recycle view, so only the visible rows have widgets (see Almrow). The list
+# is filtered by priority and tag and sorted by time, priority or tag
+class Alarms(RecycleView):
+    # Alarm of each (remote, tag) not in normal state
+    alms = ObjectProperty()
+    # Journal rows not yet written (see flushlog)
+    jbuf = ListProperty()
+    # Sorting (Time, Priority or Tag), priority filter (see PRIOF) and text
+    # the tags must contain
+    sortby = StringProperty('Time')
+    prio = StringProperty('All')
+    tagf = StringProperty()
+    # Times of the alarms of the last FLOODWIN seconds, flood state and
+    # alarms kept during floods (see FLOODF)
+    recent = ObjectProperty()
+    flood = BooleanProperty(False)
+    floodk = StringProperty('Keep HH/LL, H/L')
+    # Shelving time (see SHELVES) and expiry time of each shelved (remote, tag)
+    shelvek = StringProperty('1 h')
+    shelf = ObjectProperty()
+    # Title of the list, with the flood and shelving state
+    status = StringProperty('Alarms')
+
+    def __init__(self, **kwargs):
+        self.alms = {}
+        self.recent = deque()
+        self.shelf = {}
+        super(Alarms, self).__init__(**kwargs)
+        # The view is rebuilt at most once per frame, however many changes
+        self.trigger = Clock.create_trigger(self.refresh)
+        Clock.schedule_interval(self.expire, 1)
+
+    def on_sortby(self, *args):
+        self.trigger()
+
+    def on_prio(self, *args):
+        self.trigger()
+
+    def on_tagf(self, *args):
+        self.trigger()
+
+    # Shows the alarms that pass the filters, sorted
+    def refresh(self, *args):
+        txt = self.tagf.strip().lower()
+        rows = [a for a in self.alms.values() if PRIOS.get(a['typ'], 3) in PRIOF[self.prio] and txt in a['tag'].lower()
+                and not (a['sup'] and self.flood) and not self.caused(a) and a['key'] not in self.shelf]
+        if self.sortby == 'Priority':
+            rows.sort(key = lambda a: (PRIOS.get(a['typ'], 3), -a['tm']))
+        elif self.sortby == 'Tag':
+            rows.sort(key = lambda a: a['tag'])
         else:
-            rpfl = open(os.getcwd() + '/Reports/' + txt, 'w+')
-            als = session.query(Alarm).all()
-            for al in als:
-                if al.AL_typ == 'd':
-                    rpfl.write(al.AL_time + '\r' + str(al.dal.DP_tag) + '; ' + str(al.AL_value) + '; ' + al.AL_typ + '\r\n')
-                else:
-                    rpfl.write(al.AL_time + '\r' + str(al.aal.AP_tag) + '; ' + str(al.AL_value) + '; ' + al.AL_typ + '\r\n')
-            rpfl.close()
-
-# Inherits from Lista class (see database screen). Changes made are for alarm
-# recognition
-class Alarms(Lista):
-    # alarms present in the list
-    curr = ListProperty()
-
-    # Includes a new alarm depending on the element raising it
-    def newalm(self, tag, val, typ, tm, des):
-        if val not in self.curr:
-            rinf = session.query(RTU).first()
-            dinf = session.query(Dpoint).filter(Dpoint.DP_RTUid == rinf.RTU_id, Dpoint.DP_tag == tag).first()
-            ainf = session.query(Apoint).filter(Apoint.AP_RTUid == rinf.RTU_id, Apoint.AP_tag == tag).first()
-            if ainf == None:
-                alm = Alarm(AL_time = self.parent.parent.parent.manager.get_screen('ihmsc').ids.ihm.rtime,
-                            AL_typ = typ,
-                            AL_value = val)
-                alm.dal = dinf
-                session.add(alm)
-                session.commit()
-            elif dinf == None:
-                alm = Alarm(AL_time = self.parent.parent.parent.manager.get_screen('ihmsc').ids.ihm.rtime,
-                            AL_typ = typ,
-                            AL_value = val)
-                alm.aal = ainf
-                session.add(alm)
-                session.commit()
-            nalm = BoxLayout(spacing = 20, size_hint_y = None, height = 30)
-            self.curr.append(val)
-            t = Label(text = tm, color = (0,0,0,1))
-            nm = Label(text = tag, color = (0,0,0,1))
-            vl = Blklb(text = str(val), color = (0,0,0,1))
-            ds = Label(text = des, color = (0,0,0,1))
-            if typ == 'L' or typ == 'H':
-                ev = Label(text = typ, color=(1,1,0,1))
-            elif typ == 'LL' or typ == 'HH':
-                ev = Label(text = typ, color=(1,0,0,1))
-            elif typ == 'd':
-                ev = Label(text = 'Ha cambiado de estado', color = (0,0,0,1))
-            nalm.add_widget(t)
-            nalm.add_widget(nm)
-            nalm.add_widget(vl)
-            nalm.add_widget(ev)
-            nalm.add_widget(ds)
-            vl.mytag = tag
-            self.add_widget(nalm)
+            rows.sort(key = lambda a: -a['tm'])
+        self.data = rows
+
+    # Transition to active alarm, tm being its epoch time in seconds. Nothing
+    # is done if the tag is already active with the same event, otherwise it is
+    # registered and journaled. Alarms suppressed by a flood or by their cause
+    # are journaled as such but neither shown nor announced. Returns if it
+    # must be announced
+    def newalm(self, tag, val, typ, tm, des, rem):
+        key = (rem, tag)
+        if key in self.alms and self.alms[key]['state'] in ('unack', 'ack') and self.alms[key]['typ'] == typ:
+            return False
+        self.recent.append(tm)
+        self.expire()
+        sup = self.flood and PRIOS.get(typ, 3) > FLOODF[self.floodk]
+        ainf = points.get(('a', rem, tag))
+        dinf = points.get(('d', rem, tag))
+        inf = (ainf if ainf != None else dinf)
+        cause = (getattr(inf, inf.typ.upper() + 'P_cause') if inf != None else None)
+        alm = {'key': key, 'tag': tag, 'tm': tm, 'val': val, 'typ': typ, 'des': des, 'state': 'unack', 'sup': sup,
+               'cause': ((rem, cause) if cause and self.active((rem, cause)) else None)}
+        alm['ap'] = (ainf.id if ainf != None else None)
+        alm['dp'] = (dinf.id if dinf != None and ainf == None else None)
+        self.alms[key] = alm
+        self.trigger()
+        sup = sup or self.caused(alm)
+        self.log(alm, ('supp' if sup else 'raise'), tm)
+        return not sup and key not in self.shelf
+
+    # If the alarm of a (remote, tag) is active
+    def active(self, key):
+        return key in self.alms and self.alms[key]['state'] in ('unack', 'ack')
+
+    # If an alarm is consequential: its cause was active when it was raised
+    # and still is
+    def caused(self, alm):
+        return alm['cause'] != None and self.active(alm['cause'])
+
+    # Queues an action on the alarm of a tag for the journal (see Alarm).
+    # Alarms of points no longer on the registry (e.g. of an erased remote)
+    # are not written
+    def log(self, alm, act, tm):
+        if alm['ap'] == None and alm['dp'] == None:
+            return
+        self.jbuf.append({'AL_time': tm * 1000,
+                          'AL_typ': alm['typ'],
+                          'AL_value': alm['val'],
+                          'AL_action': act,
+                          'AL_apoint': alm['ap'],
+                          'AL_dpoint': alm['dp']})
+
+    # Writes the queued actions to the journal at once. Called with the
+    # historian flushes, so alarms don't query the database on the scan
+    def flushlog(self, *args):
+        if self.jbuf:
+            rows = self.jbuf
+            self.jbuf = []
+            session.execute(Alarm.__table__.insert(), rows)
+            session.commit()
+
+    # Transition back to normal of the alarm of a (remote, tag). Acknowledged
+    # alarms leave the list, the rest stay until the operator acknowledges them
+    def clear(self, key, tm = None):
+        if key not in self.alms:
+            return
+        self.log(self.alms[key], 'clear', (stamp() if tm == None else tm))
+        if self.alms[key]['state'] == 'unack':
+            self.alms[key]['state'] = 'clear'
+            # Its consequential alarms show up again
+            self.trigger()
+        elif self.alms[key]['state'] == 'ack':
+            self.drop(key)
+
+    # Operator acknowledgement. Active alarms stop blinking, cleared alarms
+    # leave the list
+    def ack(self, key):
+        if key not in self.alms or self.alms[key]['state'] == 'ack':
+            return
+        self.log(self.alms[key], 'ack', stamp())
+        if self.alms[key]['state'] == 'unack':
+            self.alms[key]['state'] = 'ack'
+            self.trigger()
+        elif self.alms[key]['state'] == 'clear':
+            self.drop(key)
+
+    # Removes the alarm of a (remote, tag), which goes back to normal state
+    def drop(self, key):
+        self.alms.pop(key)
+        self.trigger()
+
+    # Hides the alarms of a (remote, tag) for the shelving time
+    def shelve(self, key):
+        self.shelf[key] = stamp() + SHELVES[self.shelvek]
+        self.expire()
+        self.trigger()
+
+    def unshelve(self, *args):
+        self.shelf = {}
+        self.expire()
+        self.trigger()
+
+    # Ends the expired shelvings and updates the flood state and the title
+    def expire(self, *args):
+        now = stamp()
+        while self.recent and self.recent[0] < now - FLOODWIN:
+            self.recent.popleft()
+        old = [key for key, ex in self.shelf.items() if ex <= now]
+        for key in old:
+            self.shelf.pop(key)
+        flood = len(self.recent) > FLOODN
+        if old or flood != self.flood:
+            self.trigger()
+        self.flood = flood
+        self.status = 'Alarms'
+        if flood:
+            self.status += ' - Flood, %d suppressed' % len([a for a in self.alms.values() if a['sup']])
+        cons = len([a for a in self.alms.values() if self.caused(a)])
+        if cons:
+            self.status += ' - %d consequential' % cons
+        if self.shelf:
+            self.status += ' - %d shelved' % len(self.shelf)
+
+# Row of the alarm list, recycled to show any alarm (see Alarms). The value
+# blinks while the alarm is not acknowledged. A click acknowledges it, its
+# button shelves the tag
+class Almrow(RecycleDataViewBehavior, BoxLayout):
+    # (remote, tag) of the alarm shown
+    key = ObjectProperty()
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.key = data['key']
+        self.ids['t'].text = strtime(data['tm'] * 1000)[11:]
+        self.ids['nm'].text = data['tag']
+        self.ids['vl'].text = str(data['val'])
+        if data['typ'] in ('L', 'H'):
+            self.ids['ev'].text, self.ids['ev'].color = data['typ'], (1,1,0,1)
+        elif data['typ'] in ('LL', 'HH'):
+            self.ids['ev'].text, self.ids['ev'].color = data['typ'], (1,0,0,1)
+        else:
+            self.ids['ev'].text, self.ids['ev'].color = 'Ha cambiado de estado', (0,0,0,1)
+        self.ids['ds'].text = data['des']
+        if data['state'] == 'ack':
+            self.ids['vl'].stop()
+        else:
+            self.ids['vl'].start()
+
+    def on_touch_down(self, touch):
+        if self.ids['shv'].collide_point(*touch.pos):
+            return super(Almrow, self).on_touch_down(touch)
+        if self.collide_point(*touch.pos) and self.parent != None:
+            self.parent.parent.ack(self.key)
+            return True
+        return super(Almrow, self).on_touch_down(touch)
 
 # Blinking label
 class Blklb(Label):
-    # Indicates if label is currently highlighted
-    hlted = BooleanProperty(False)
-    # tag associated with label
-    mytag = StringProperty()
-
-    # Schedules blinking on init
+    # The highlight is drawn once, blinking only changes its color
     def __init__(self, **kwargs):
         super(Blklb, self).__init__(**kwargs)
-        Clock.schedule_interval(self.blink, 1)
-
-    # BLink mechanics
-    def blink(self, *args):
-        if not self.hlted:
-            with self.canvas.before:
-                Color(*(1,1,1,0.75))
-                Rectangle(pos = self.pos, size = self.size)
-            self.hlted = True
-        else:
-            with self.canvas.before:
-                Color(*(get_color_from_hex('#87FFFC')))
-                Rectangle(pos = self.pos, size = self.size)
-            self.hlted = False
-
-    # Alarm recognition mechanics on click:
-    # If widget is still on alarm state, blinking stops but alarm stays on list
-    # If widget is not on alarm state, alarm disappears from the list
-    def on_touch_down(self, touch):
-        super(Blklb, self).on_touch_down(touch)
-        if self.parent.collide_point(touch.x, touch.y):
-            for kid in self.parent.parent.parent.parent.parent.manager.get_screen('ihmsc').ids.ihm.children:
-                try:
-                    if kid.name == self.mytag and kid.alarming:
-                        Clock.unschedule(self.blink)
-                        self.canvas.before.clear()
-                    elif kid.name == self.mytag and not kid.alarming:
-                        Clock.unschedule(self.blink)
-                        self.parent.parent.remove_widget(self.parent)
-                        self.canvas.before.clear()
-                except:
-                    continue
-            if self.text == '1' or self.text == '0':
-                self.parent.parent.remove_widget(self.parent)
-                self.canvas.before.clear()
+        with self.canvas.before:
+            self.hl = Color(0, 0, 0, 0)
+            self.rect = Rectangle(pos = self.pos, size = self.size)
+        self.bind(pos = self.place, size = self.place)
+
+    def place(self, *args):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+
+    # Starts blinking (see Flash)
+    def start(self, *args):
+        FLASH.add(self)
+
+    # Stops blinking and erases the highlight
+    def stop(self, *args):
+        FLASH.remove(self)
+        self.hl.rgba = (0, 0, 0, 0)
+
+# Blink clock shared by every alarm label. A single clock, running only
+# while some label blinks, flips the highlight color of all of them at once
+class Flash(object):
+    def __init__(self):
+        self.lbs = set()
+        self.lit = False
+
+    def add(self, lb):
+        if not self.lbs:
+            Clock.schedule_interval(self.tick, 1)
+        self.lbs.add(lb)
+
+    def remove(self, lb):
+        self.lbs.discard(lb)
+        if not self.lbs:
+            Clock.unschedule(self.tick)
+
+    def tick(self, *args):
+        self.lit = not self.lit
+        rgba = ((1,1,1,0.75) if self.lit else get_color_from_hex('#87FFFC'))
+        for lb in self.lbs:
+            lb.hl.rgba = rgba
+
+FLASH = Flash()
 
 # Plotting area class
 class PlotArea(BoxLayout):
@@ -2376,9 +3633,193 @@ class PlotArea(BoxLayout):
     numtime = ListProperty()
     timeset = BooleanProperty(False)
     plotting = BooleanProperty(False)
+    # Time window of the trends in seconds (see WINDOWS), 0 for the live trend
+    window = NumericProperty(0)
+    # Epoch time (ms) of the start of the window
+    wstart = NumericProperty(0)
+    # x axis range of the live trend while a window is displayed
+    livemax = NumericProperty(60)
+    # Trend pens by (remote, tag) (see Pen)
+    pens = ObjectProperty()
+    # Pens created, to pick the color of the next one
+    npens = NumericProperty(0)
+    # (remote, tag) of the pen whose scale is shown on the y axis
+    axis = ObjectProperty(None, allownone = True)
+    # Historic trends: Buckets of the loaded windows, by ((remote, tag), start,
+    # window, width), and the windows still being read as (cache key, trendrows)
+    cache = ObjectProperty()
+    jobs = ListProperty()
+
+    def __init__(self, **kwargs):
+        self.pens = {}
+        self.cache = {}
+        super(PlotArea, self).__init__(**kwargs)
+
+    # Adds the pen of a tag of a remote with a y axis range of lo to hi, or
+    # updates its range if the tag already has one
+    def addpen(self, tag, lo, hi, rem = '', *args):
+        pk = (rem, tag)
+        if pk in self.pens:
+            self.pens[pk].lo = lo
+            self.pens[pk].hi = hi
+        else:
+            clr = PENCOLORS[self.npens % len(PENCOLORS)]
+            self.npens += 1
+            pen = Pen(tag = tag, lo = lo, hi = hi, area = self, color = clr,
+                      plot = MeshLinePlot(color = clr), rem = rem)
+            self.pens[pk] = pen
+            self.parent.parent.ids['pens'].add_widget(pen)
+            pen.ids['chk'].active = True
+        if self.axis == None or self.axis == pk:
+            self.setaxis(pk)
+        if self.window:
+            self.load()
+
+    # Adds the pens of the analog points of the tags written on the trends
+    # screen, separated by commas. A tag is written as remote:tag, or alone
+    # for the tag on every remote
+    def addtag(self, txt, *args):
+        for tx in [t.strip() for t in txt.split(',') if t.strip() != '']:
+            rem, tag = (tx.split(':', 1) if ':' in tx else (None, tx))
+            for an in [p for p in points.values() if p.typ == 'a' and p.tag == tag.strip() and rem in (None, p.rem)]:
+                self.addpen(an.tag, float(an.AP_clowlimit), float(an.AP_chilimit), an.rem)
+
+    # Removes the pen of a (remote, tag)
+    def rmpen(self, pk, *args):
+        pen = self.pens.pop(pk)
+        pen.ids['chk'].active = False
+        self.parent.parent.ids['pens'].remove_widget(pen)
+        if self.axis == pk:
+            self.setaxis(next(iter(self.pens), None))
+
+    # Shows the scale of a pen on the y axis. The rest of the pens are drawn
+    # scaled so that their own range fills the axis
+    def setaxis(self, pk, *args):
+        self.axis = pk
+        if pk in self.pens:
+            grafi = self.parent.parent.ids['grafi']
+            lo = self.pens[pk].lo
+            hi = max(self.pens[pk].hi, lo + 1)
+            grafi.ymin = lo
+            grafi.ymax = hi
+            grafi.y_ticks_major = (hi - lo) / 10.
+        self.parent.parent.manager.get_screen('ihmsc').ids.ihm.drawn = {}
+        if self.window:
+            self.draw()
+
+    # Shows the trends of the last time window selected, or the live trend
+    def setwindow(self, txt, *args):
+        if WINDOWS[txt] == self.window == 0:
+            return
+        grafi = self.parent.parent.ids['grafi']
+        if self.window == 0:
+            self.livemax = grafi.xmax
+        self.window = WINDOWS[txt]
+        if self.window:
+            self.wstart = int((time.time() - self.window) * 1000)
+            self.load()
+        else:
+            Clock.unschedule(self.feed)
+            self.jobs = []
+            self.cache = {}
+            grafi.xmax = self.livemax
+            for n, ts in enumerate(self.strtime[:6]):
+                self.parent.parent.ids['t' + str(n + 1)].text = ts
+            ihm = self.parent.parent.manager.get_screen('ihmsc').ids.ihm
+            ihm.drawn = {}
+            ihm.plotel()
+
+    # Moves the historic window by n windows (negative to the past)
+    def pan(self, n, *args):
+        if self.window:
+            self.wstart += int(n * self.window * 1000)
+            self.load()
+
+    # Multiplies the span of the historic window by k, keeping its center
+    def zoom(self, k, *args):
+        if self.window and self.window * k >= 60:
+            self.wstart += int((self.window - self.window * k) * 500)
+            self.window = int(self.window * k)
+            self.load()
+
+    # Loads the historic trends of the window. The windows before and after it
+    # are prefetched, so panning shows them at once. Windows not loaded yet are
+    # read by chunks, one per frame, so the interface stays responsive
+    def load(self, *args):
+        grafi = self.parent.parent.ids['grafi']
+        w = max(int(grafi.width), 1)
+        win = self.window * 1000
+        grafi.xmax = self.window
+        fm = ('%H:%M' if self.window <= 86400 else '%d/%m %H:%M')
+        for n in range(6):
+            tm = (self.wstart / 1000.) + n * self.window / 5.
+            self.parent.parent.ids['t' + str(n + 1)].text = time.strftime(fm, time.localtime(tm))
+        for pen in self.pens.values():
+            pen.keys = tagkeys(pen.rem, pen.tag)
+        need = []
+        for st in (self.wstart, self.wstart - win, self.wstart + win):
+            for pk, pen in self.pens.items():
+                if pen.keys:
+                    need.append(((pk, st, win, w), pen.keys))
+        keep = dict(need)
+        for ck in list(self.cache):
+            if ck not in keep:
+                del self.cache[ck]
+        self.jobs = [jb for jb in self.jobs if jb[0] in keep]
+        busy = [jb[0] for jb in self.jobs]
+        for ck, keys in need:
+            if ck not in self.cache:
+                self.cache[ck] = Buckets(ck[1], win, w)
+                self.jobs.append((ck, trendrows(keys, ck[1], ck[1] + win, w)))
+            elif ck in busy and ck[1] == self.wstart:
+                # The visible window goes first
+                jb = self.jobs.pop(busy.index(ck))
+                self.jobs.insert(0, jb)
+                busy = [j[0] for j in self.jobs]
+        self.draw()
+        Clock.unschedule(self.feed)
+        if self.jobs:
+            Clock.schedule_interval(self.feed, 0)
+
+    # Reads a chunk of the first window pending
+    def feed(self, *args):
+        if not self.jobs:
+            return False
+        ck, rows = self.jobs[0]
+        chunk = []
+        for rw in rows:
+            chunk.append(rw)
+            if len(chunk) == PAGE:
+                break
+        if chunk:
+            self.cache[ck].add(np.array(chunk, dtype = float))
+        if len(chunk) < PAGE:
+            self.jobs.pop(0)
+        if ck[1] == self.wstart:
+            self.draw()
+
+    # Draws the loaded part of the window of each pen
+    def draw(self, *args):
+        w = max(int(self.parent.parent.ids['grafi'].width), 1)
+        for pk, pen in self.pens.items():
+            bk = self.cache.get((pk, self.wstart, self.window * 1000, w))
+            pen.plot.points = (bk.points(pen) if bk != None else [])
+
+    # Reloads the windows with data after the epoch time t (ms), which has
+    # just been written to the historian
+    def refresh(self, t, *args):
+        if self.window:
+            for ck in list(self.cache):
+                if ck[1] + ck[2] > t:
+                    del self.cache[ck]
+            self.jobs = [jb for jb in self.jobs if jb[0] in self.cache]
+            self.load()
 
     def expand(self, *args):
-        self.parent.parent.ids['grafi'].xmax = self.parent.parent.ids['grafi'].xmax + 60
+        if self.window:
+            self.livemax += 60
+        else:
+            self.parent.parent.ids['grafi'].xmax = self.parent.parent.ids['grafi'].xmax + 60
         for num in range(len(self.numtime[1:6])):
             self.numtime[num + 1] = self.numtime[num + 1] + (12 * (num + 1))
         strt = []
@@ -2416,21 +3857,48 @@ class PlotArea(BoxLayout):
             self.strtime.append(tm[0] + tm[1] + tm[2])
         n = 1
         for ts in self.strtime:
-            self.parent.parent.ids['t' + str(n)].text = ts
+            if not self.window:
+                self.parent.parent.ids['t' + str(n)].text = ts
             n += 1
 
+# Trend pen: legend entry and plot of a tag. Its values are scaled from its
+# own range (lo to hi) to the range of the y axis
+class Pen(BoxLayout):
+    tag = StringProperty()
+    color = ListProperty()
+    lo = NumericProperty(0)
+    hi = NumericProperty(100)
+    plot = ObjectProperty()
+    # PlotArea the pen belongs to
+    area = ObjectProperty()
+    # Remote of the tag and point keys for the historic trends (see tagkeys)
+    rem = StringProperty()
+    keys = ListProperty()
+
+    # Values of the tag mapped to the y axis
+    def scale(self, vals):
+        grafi = self.area.parent.parent.ids['grafi']
+        span = max(self.hi - self.lo, 1e-9)
+        return (vals - self.lo) / span * (grafi.ymax - grafi.ymin) + grafi.ymin
+
+    # Adds or removes the plot from the graph
+    def show(self, on):
+        grafi = self.area.parent.parent.ids['grafi']
+        if on and self.plot not in grafi.plots:
+            grafi.add_plot(self.plot)
+            self.area.parent.parent.manager.get_screen('ihmsc').ids.ihm.drawn.pop(self.tag, None)
+            if self.area.window:
+                self.area.draw()
+        elif not on and self.plot in grafi.plots:
+            grafi.remove_plot(self.plot)
+
 # Checkbox that plots/unplots values from selected/unselected element
 class Gcheck(CheckBox):
-    myplot = StringProperty()
 
     def on_active(self, *args):
         super(Gcheck, self).on_active(*args)
-        if not self.active and self.parent.parent.parent.parent.parent.ids['ATbox'].plotting:
-            Clock.unschedule(self.parent.parent.parent.parent.parent.manager.get_screen('ihmsc').ids.ihm.plotel)
-            self.parent.parent.parent.parent.parent.ids['grafi'].remove_plot(self.parent.parent.parent.parent.parent.manager.get_screen('ihmsc').ids.ihm.plot[int(self.myplot)])
-        elif self.active and self.parent.parent.parent.parent.parent.manager.get_screen('ihmsc').ids.ihm.running:
-            Clock.schedule_interval(self.parent.parent.parent.parent.parent.manager.get_screen('ihmsc').ids.ihm.plotel, 0.2)
-            self.parent.parent.parent.parent.parent.ids['grafi'].add_plot(self.parent.parent.parent.parent.parent.manager.get_screen('ihmsc').ids.ihm.plot[int(self.myplot)])
+        if isinstance(self.parent, Pen):
+            self.parent.show(self.active)
 
 ################# Final App class and execution
 # Loads the .kv file (widget tree structure)
@@ -2453,8 +3921,11 @@ class microIHMApp(App):
     # Method to shut communications with the microcontroller when apps is closed
     def on_stop(self, **kwargs):
         super(microIHMApp, self).on_stop(**kwargs)
-        if not self.root_window.children[0].get_screen('ihmsc').ids['ihm'].ard == []:
-            self.root_window.children[0].get_screen('ihmsc').ids['ihm'].ard[0].exit()
+        for wk in self.root_window.children[0].get_screen('ihmsc').ids['ihm'].ard.values():
+            wk.stop()
+        self.root_window.children[0].get_screen('ihmsc').ids['ihm'].shut()
+        self.root_window.children[0].get_screen('ihmsc').ids['ihm'].flush()
+        closeroll()
 
 # execution
 if __name__=='__main__':